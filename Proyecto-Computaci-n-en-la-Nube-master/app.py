@@ -1,50 +1,412 @@
-from flask import Flask, request, jsonify, session
-from flask_restx import Api, Resource, fields
+from flask import Flask, Response, request, jsonify, session, stream_with_context
+from flask_restx import Api, Resource, fields, inputs
 from flask_cors import CORS  # Importa CORS
-import firebase_admin
-from firebase_admin import credentials, firestore, auth, storage
 from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial, wraps
+import base64
+import binascii
+import codecs
+import contextvars
+import csv
+import hashlib
+import inspect
+import io
+import json
 import logging
-
-#Inicializar la app de Flask
-app = Flask(__name__)
-app.secret_key = '121003'
-app.config.update(
-    SESSION_COOKIE_SECURE=True,  # Solo cookies seguras bajo HTTPS
-    SESSION_COOKIE_HTTPONLY=True,  # Las cookies no son accesibles desde JavaScript
-    SESSION_COOKIE_SAMESITE='None'  # Necesario para compartir cookies entre dominios diferentes
-)
-# Configurar CORS
-CORS(app, resources={r"/*": {"origins": "http://localhost:5173", "supports_credentials": True}})
-
-#Inicializar API con Flask-RESTX
-api = Api(app, version='1.0', title='Bienes Raices API', 
+import os
+import random
+import threading
+import time
+import uuid
+import zipfile
+from cache import crear_cache
+from clientes import ClientePerezoso
+from compresion import instalar_compresion
+from geoespacial import (celdas_del_rectangulo, codificar as codificar_geohash, dentro_del_rectangulo,
+                          diagonal_km, distancia_km, rangos_de_celdas, rectangulo_de_radio, validar_coordenadas)
+from indice_busqueda import IndiceBienesRaices, CAMPOS_ORDENABLES
+from serializacion import Serializador, codificar_json
+from procesamiento_imagenes import ProcesadorImagenes, ColaLlena, hashear_archivo, COLECCION_IMAGENES
+from limpieza_storage import LimpiadorStorage
+from metricas import Metricas, instalar_metricas, instrumentar_firestore, instrumentar_storage
+
+# Latencia por ruta y estado para /metrics; METRICAS_UMBRAL_LENTO_MS registra el desglose de las peticiones lentas
+metricas = Metricas()
+
+#Inicializar API con Flask-RESTX; las rutas se registran en cada app que crea crear_app()
+api = Api(version='1.0', title='Bienes Raices API', 
           description='API para gestionar bienes raíces, usuarios y boletas', 
           doc='/swagger/') #Ruta para la documentación de Swagger
-#Inicializar Firebase
-
-cred = credentials.Certificate('Proyecto-Computaci-n-en-la-Nube-master/config/bienesraicesapp-2082b-firebase-adminsdk-ouekj-b5ece7fcfb.json')
-firebase_admin.initialize_app(cred, {'storageBucket':'gs://bienesraicesapp-2082b.appspot.com'})
 
-#Inicializar Firestore
-db = firestore.client()
-bucket = storage.bucket('bienesraicesapp-2082b.appspot.com')
+def crear_app(config=None):
+    """Crea la app de Flask con la API registrada.
+
+    No abre conexiones: los clientes de Firebase se crean en el primer uso de
+    cada proceso, así que la app se puede crear antes de hacer fork de los workers.
+    """
+    #Inicializar la app de Flask
+    app = Flask(__name__)
+    app.secret_key = '121003'
+    app.config.update(
+        SESSION_COOKIE_SECURE=True,  # Solo cookies seguras bajo HTTPS
+        SESSION_COOKIE_HTTPONLY=True,  # Las cookies no son accesibles desde JavaScript
+        SESSION_COOKIE_SAMESITE='None'  # Necesario para compartir cookies entre dominios diferentes
+    )
+    if config:
+        app.config.update(config)
+    # Configurar CORS
+    CORS(app, resources={r"/*": {"origins": "http://localhost:5173", "supports_credentials": True}})
+    # Las métricas van primero para que su after_request incluya el tiempo de compresión
+    umbral_lento = os.environ.get('METRICAS_UMBRAL_LENTO_MS')
+    instalar_metricas(app, metricas, umbral_lento=float(umbral_lento) / 1000 if umbral_lento else None)
+    # Comprimir con gzip/brotli las respuestas que superan COMPRESION_UMBRAL bytes
+    instalar_compresion(app, umbral=int(os.environ.get('COMPRESION_UMBRAL', 1024)))
+    if os.environ.get('INDICE_LISTENER') == '1' and BACKEND_DATOS == 'firebase':
+        app.before_request(iniciar_listener_indice)
+    api.init_app(app)
+    return app
+
+# Backend de datos: 'firebase' (por defecto) o 'memoria' para pruebas y benchmarks
+BACKEND_DATOS = os.environ.get('BACKEND_DATOS', 'firebase')
 bucket_name = 'bienesraicesapp-2082b.appspot.com'
+
+if BACKEND_DATOS == 'memoria':
+    import backend_memoria as firestore  # Provee Increment y transactional
+    from backend_memoria import crear_backend_memoria
+    # BACKEND_LATENCIA_MS simula el tiempo de ida y vuelta de cada llamada
+    db, bucket, auth = crear_backend_memoria(
+        bucket_name,
+        latencia=float(os.environ.get('BACKEND_LATENCIA_MS', 0)) / 1000,
+        variacion=float(os.environ.get('BACKEND_VARIACION_MS', 0)) / 1000)
+else:
+    from firebase_admin import firestore  # Provee Increment y transactional; no crea clientes
+
+    RUTA_CREDENCIALES = os.environ.get(
+        'FIREBASE_CREDENCIALES',
+        'Proyecto-Computaci-n-en-la-Nube-master/config/bienesraicesapp-2082b-firebase-adminsdk-ouekj-b5ece7fcfb.json')
+    _firebase = {'app': None, 'pid': None}
+
+    def app_firebase():
+        # Cada proceso inicializa su propia app de Firebase: los clientes que guarda una app
+        # creada antes del fork tendrían canales gRPC heredados
+        if _firebase['pid'] != os.getpid():
+            import firebase_admin
+            from firebase_admin import credentials
+
+            #Inicializar Firebase
+            cred = credentials.Certificate(RUTA_CREDENCIALES)
+            _firebase['app'] = firebase_admin.initialize_app(
+                cred, {'storageBucket':'gs://bienesraicesapp-2082b.appspot.com'}, name=f'bienes-raices-{os.getpid()}')
+            _firebase['pid'] = os.getpid()
+        return _firebase['app']
+
+    class AuthFirebase:
+        # firebase_admin.auth con la app de este proceso en lugar de la app por defecto
+        def __init__(self, app):
+            from firebase_admin import auth as modulo_auth
+            self._modulo = modulo_auth
+            self._app = app
+
+        def __getattr__(self, nombre):
+            valor = getattr(self._modulo, nombre)
+            return partial(valor, app=self._app) if inspect.isfunction(valor) else valor
+
+    def crear_bucket():
+        from firebase_admin import storage
+        return storage.bucket(bucket_name, app=app_firebase())
+
+    #Inicializar Firestore, Storage y Auth en su primer uso
+    db = ClientePerezoso(lambda: firestore.client(app_firebase()), 'firestore')
+    bucket = ClientePerezoso(crear_bucket, 'storage')
+    auth = ClientePerezoso(lambda: AuthFirebase(app_firebase()), 'auth')
+
+# Cada llamada a Firestore y Storage se cuenta y se mide en las métricas
+db = instrumentar_firestore(db, metricas)
+bucket = instrumentar_storage(bucket, metricas)
+
 # Configuración de logging
 logging.basicConfig(level=logging.DEBUG)
 
+# Caché de lectura para los bienes raíces (CACHE_REDIS_URL la comparte entre workers)
+cache = crear_cache(capacidad=int(os.environ.get('CACHE_CAPACIDAD', 1024)),
+                    ttl=float(os.environ.get('CACHE_TTL', 60)),
+                    redis_url=os.environ.get('CACHE_REDIS_URL'),
+                    ttl_versiones=float(os.environ.get('CACHE_TTL_VERSIONES', 24 * 3600)))
+
+def invalidar_bien_raiz(bien_id=None):
+    # Los listados se invalidan todos juntos incrementando su versión
+    version = cache.incrementar_version('bienes_raices')
+    # Quien escribe también actualiza el índice de este proceso, que sigue al día con la nueva versión
+    indice_bienes.avanzar_version(version)
+    if bien_id is not None:
+        # El detalle también se versiona: con CACHE_REDIS_URL la nueva versión invalida la copia
+        # local de todos los workers, no solo la de este proceso
+        cache.incrementar_version(f'bien_raiz:{bien_id}')
+
+def etag_documentos(docs, *partes):
+    # ETag fuerte a partir del id y el update_time de cada documento, sin serializar el cuerpo
+    sha = hashlib.sha1()
+    for parte in partes:
+        sha.update(f'{parte}\x1f'.encode('utf-8'))
+    for doc in docs:
+        sha.update(f'{doc.id}\x1e{doc.update_time}\x1f'.encode('utf-8'))
+    return sha.hexdigest()
+
+def encabezados_etag(etag, privada=False):
+    # no-cache: el cliente puede guardar la respuesta pero debe revalidarla con If-None-Match
+    return {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache' if privada else 'no-cache'}
+
+def respuesta_no_modificada(etag, privada=False):
+    # Devuelve un 304 si el cliente ya tiene esta versión, o None.
+    # Se ignora el sufijo que agrega la compresión (-gzip, -br) al ETag
+    condicion = request.if_none_match
+    if condicion.star_tag or any(candidato.split('-', 1)[0] == etag
+                                 for candidato in condicion.as_set(include_weak=True)):
+        return Response(status=304, headers=encabezados_etag(etag, privada))
+    return None
+
+# Índice en memoria para /bienes_raices/buscar; se carga en la primera búsqueda
+indice_bienes = IndiceBienesRaices()
+# Sin listener, el índice se recarga cuando cambia la versión de los bienes raíces (las escrituras
+# de otros workers solo se ven con CACHE_REDIS_URL), a lo sumo cada INDICE_INTERVALO_MINIMO segundos,
+# y siempre que su carga tenga más de INDICE_TTL segundos
+INDICE_TTL = float(os.environ.get('INDICE_TTL', 300))
+INDICE_INTERVALO_MINIMO = float(os.environ.get('INDICE_INTERVALO_MINIMO', 5))
+
+def documentos_bienes_raices():
+    return [(doc.id, doc.to_dict() or {}) for doc in db.collection('bienes_raices').stream()]
+
+_listener = {'pid': None}
+_listener_lock = threading.Lock()
+
+def iniciar_listener_indice():
+    # Con varios workers el listener mantiene el índice al día con las escrituras de los demás.
+    # Se inicia en la primera petición de cada proceso, nunca antes del fork
+    if _listener['pid'] == os.getpid():
+        return
+    with _listener_lock:
+        if _listener['pid'] != os.getpid():
+            db.collection('bienes_raices').on_snapshot(
+                lambda docs, cambios, leido_en: indice_bienes.aplicar_snapshot(cambios))
+            _listener['pid'] = os.getpid()
+
+def imagen_procesada(bien_id, cambios):
+    # El procesador ya actualizó Firestore; falta refrescar la caché y el índice
+    invalidar_bien_raiz(bien_id)
+    indice_bienes.actualizar(bien_id, cambios)
+
+def marcar_imagen_con_error(imagen_hash, bien_ids):
+    # La imagen no se pudo guardar ni encolar. Con estado 'error' sus bienes raíces lo muestran
+    # y la próxima subida del mismo archivo la vuelve a procesar
+    db.collection(COLECCION_IMAGENES).document(imagen_hash).update({'estado': 'error'})
+    lote = db.batch()
+    for bien_id in bien_ids:
+        lote.update(db.collection('bienes_raices').document(bien_id), {'imagen_estado': 'error'})
+    lote.commit()
+    for bien_id in bien_ids:
+        imagen_procesada(bien_id, {'imagen_estado': 'error'})
+
+class ImagenEnEliminacion(Exception):
+    pass
+
+# Una imagen pendiente desde hace más que esto se da por abandonada (por ejemplo, si el
+# proceso que la procesaba terminó) y la próxima subida del mismo archivo la vuelve a procesar
+IMAGEN_PENDIENTE_MAXIMA = timedelta(seconds=int(os.environ.get('IMAGEN_PENDIENTE_MAXIMA', 600)))
+
+def imagen_abandonada(imagen):
+    desde = imagen.get('pendiente_desde')
+    return imagen.get('estado') == 'pendiente' and (
+        desde is None or desde < datetime.now(timezone.utc) - IMAGEN_PENDIENTE_MAXIMA)
+
+def sumar_referencias_imagen(transaccion, imagen_ref, cantidad, metadatos, registro=None):
+    # Suma referencias a una imagen dentro de una transacción (antes de cualquier escritura).
+    # Si el registro ya se leyó en la transacción se recibe en registro.
+    # Devuelve (si hay que procesarla, variantes si ya está lista)
+    if registro is None:
+        registro = imagen_ref.get(transaction=transaccion)
+    if not registro.exists:
+        transaccion.set(imagen_ref, dict(metadatos, referencias=cantidad, estado='pendiente',
+                                         pendiente_desde=datetime.now(timezone.utc)))
+        return True, None
+
+    imagen = registro.to_dict()
+    if imagen.get('estado') == 'eliminando':
+        # Sus blobs se están borrando en este momento; reutilizarla dejaría URLs rotas
+        raise ImagenEnEliminacion("La imagen se está eliminando, intente nuevamente en unos segundos")
+    cambios = {'referencias': firestore.Increment(cantidad)}
+    procesar = imagen.get('estado') == 'error' or imagen_abandonada(imagen)
+    if procesar:
+        # Un intento anterior falló o quedó abandonado: esta subida vuelve a procesarla
+        cambios.update(estado='pendiente', pendiente_desde=datetime.now(timezone.utc))
+    transaccion.update(imagen_ref, cambios)
+    return procesar, imagen.get('variantes') if imagen.get('estado') == 'lista' else None
+
+reservar_imagen = firestore.transactional(sumar_referencias_imagen)
+
+def datos_imagen_lista(variantes):
+    return {'imagen_url': variantes['completa'], 'imagenes': variantes, 'imagen_estado': 'lista'}
+
+@firestore.transactional
+def crear_bien_raiz_con_imagen(transaccion, bien_ref, imagen_ref, datos_bien, metadatos):
+    # Crea el bien raíz y suma una referencia a su imagen en una sola escritura.
+    # Devuelve (datos guardados, si hay que procesar la imagen)
+    procesar, variantes = sumar_referencias_imagen(transaccion, imagen_ref, 1, metadatos)
+    datos = dict(datos_bien)
+    if variantes is not None:
+        datos.update(datos_imagen_lista(variantes))
+    transaccion.set(bien_ref, datos)
+    return datos, procesar
+
+# Cada bien raíz eliminado es una escritura y cada imagen distinta otra; una transacción admite 500
+ELIMINAR_POR_LOTE = 250
+
+@firestore.transactional
+def eliminar_lote(transaccion, bien_refs, vendedor_id=None):
+    # Borra los bienes raíces y descuenta las referencias de sus imágenes en un solo commit.
+    # Con vendedor_id solo se borran los de ese vendedor. Devuelve (eliminados, rechazados, hashes)
+    eliminados, rechazados, por_hash = [], [], {}
+    for bien in db.get_all(bien_refs, transaction=transaccion):
+        if not bien.exists:
+            continue
+        datos = bien.to_dict()
+        if vendedor_id is not None and datos.get('vendedor_id') != vendedor_id:
+            rechazados.append(bien.id)
+            continue
+        eliminados.append(bien.id)
+        if datos.get('imagen_hash'):
+            por_hash[datos['imagen_hash']] = por_hash.get(datos['imagen_hash'], 0) + 1
+
+    imagen_refs = [db.collection(COLECCION_IMAGENES).document(imagen_hash) for imagen_hash in por_hash]
+    existentes = set()
+    if imagen_refs:
+        existentes = {imagen.id for imagen in db.get_all(imagen_refs, transaction=transaccion) if imagen.exists}
+
+    for bien_id in eliminados:
+        transaccion.delete(db.collection('bienes_raices').document(bien_id))
+    for imagen_ref in imagen_refs:
+        if imagen_ref.id in existentes:
+            transaccion.update(imagen_ref, {'referencias': firestore.Increment(-por_hash[imagen_ref.id])})
+    return eliminados, rechazados, list(por_hash)
+
+def eliminar_bienes_raices(bien_ids, vendedor_id=None):
+    # Elimina por lotes y deja el borrado de las imágenes sin uso en segundo plano
+    eliminados, rechazados = [], []
+    bien_ids = list(dict.fromkeys(bien_ids))
+    for inicio in range(0, len(bien_ids), ELIMINAR_POR_LOTE):
+        refs = [db.collection('bienes_raices').document(bien_id) for bien_id in bien_ids[inicio:inicio + ELIMINAR_POR_LOTE]]
+        lote_eliminados, lote_rechazados, hashes = eliminar_lote(db.transaction(), refs, vendedor_id)
+        for bien_id in lote_eliminados:
+            invalidar_bien_raiz(bien_id)
+            indice_bienes.eliminar(bien_id)
+        limpiador_storage.programar_liberacion(hashes)
+        eliminados.extend(lote_eliminados)
+        rechazados.extend(lote_rechazados)
+    return eliminados, rechazados
+
+# Reintentos de la transacción de venta cuando hay contención sobre el mismo bien raíz
+VENTA_MAX_INTENTOS = 5
+# Estados de venta que dejan el bien raíz como vendido
+ESTADOS_VENTA_ACTIVOS = ('pendiente', 'completada')
+
+# Resúmenes de ventas por vendedor y comprador, repartidos en shards para evitar
+# contención cuando un mismo usuario registra muchas ventas a la vez
+COLECCION_RESUMEN = 'resumen_ventas'
+RESUMEN_SHARDS = int(os.environ.get('RESUMEN_SHARDS', 4))
+
+def referencias_resumen(rol, usuario_id):
+    return [db.collection(COLECCION_RESUMEN).document(f'{rol}_{usuario_id}_{shard}') for shard in range(RESUMEN_SHARDS)]
+
+def delta_resumen(venta):
+    # Incrementos que una venta suma a un resumen (conteos y totales por estado, forma de pago y mes)
+    precio = venta.get('precio_final') or 0
+    mes = (venta.get('fecha_venta') or '')[:7] or 'sin_fecha'
+    grupo = {'cantidad': firestore.Increment(1), 'total': firestore.Increment(precio)}
+    return {
+        'cantidad': firestore.Increment(1),
+        'total': firestore.Increment(precio),
+        'por_estado': {venta.get('estado') or 'sin_estado': dict(grupo)},
+        'por_forma_pago': {venta.get('forma_pago') or 'sin_forma_pago': dict(grupo)},
+        'por_mes': {mes: dict(grupo)}
+    }
+
+def sumar_resumenes(snapshots):
+    # Combina los shards de un resumen en un solo dict
+    resumen = {'cantidad': 0, 'total': 0, 'por_estado': {}, 'por_forma_pago': {}, 'por_mes': {}}
+    for snapshot in snapshots:
+        datos = snapshot.to_dict() if snapshot.exists else None
+        if not datos:
+            continue
+        resumen['cantidad'] += datos.get('cantidad', 0)
+        resumen['total'] += datos.get('total', 0)
+        for grupo in ('por_estado', 'por_forma_pago', 'por_mes'):
+            for clave, valores in (datos.get(grupo) or {}).items():
+                destino = resumen[grupo].setdefault(clave, {'cantidad': 0, 'total': 0})
+                destino['cantidad'] += valores.get('cantidad', 0)
+                destino['total'] += valores.get('total', 0)
+    resumen['por_mes'] = dict(sorted(resumen['por_mes'].items()))
+    return resumen
+
+class ErrorVenta(Exception):
+    def __init__(self, mensaje, codigo):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+@firestore.transactional
+def registrar_venta(transaccion, bien_raiz_ref, venta_ref, datos_venta):
+    # El rol del comprador viene de la sesión; aquí solo se lee el bien raíz
+    bien_raiz_data = bien_raiz_ref.get(transaction=transaccion).to_dict()
+
+    # Validar que el bien raíz existe
+    if not bien_raiz_data:
+        raise ErrorVenta("El bien raíz no existe", 404)
+
+    vendedor_id = bien_raiz_data.get('vendedor_id')  # Obtener el vendedor asociado al bien raíz
+    if not vendedor_id:
+        raise ErrorVenta("No se ha asignado un vendedor a este bien raíz", 404)
+
+    if bien_raiz_data.get('estado_venta') in ESTADOS_VENTA_ACTIVOS:
+        raise ErrorVenta("El bien raíz ya fue vendido", 409)
+
+    venta = dict(datos_venta, vendedor_id=vendedor_id)
+    transaccion.set(venta_ref, venta)
+
+    # Los resúmenes se actualizan en el mismo commit que la venta, en un shard al azar
+    shard = random.randrange(RESUMEN_SHARDS)
+    for rol, usuario_id in (('vendedor', vendedor_id), ('comprador', venta['comprador_id'])):
+        resumen_ref = referencias_resumen(rol, usuario_id)[shard]
+        transaccion.set(resumen_ref, dict(delta_resumen(venta), rol=rol, usuario_id=usuario_id), merge=True)
+    if datos_venta['estado'] in ESTADOS_VENTA_ACTIVOS:
+        # Marcar el bien raíz como vendido en la misma transacción evita ventas dobles
+        transaccion.update(bien_raiz_ref, {'estado_venta': datos_venta['estado'], 'venta_id': venta_ref.id})
+
+# Pool en segundo plano que genera y sube las variantes de las imágenes
+procesador_imagenes = ProcesadorImagenes(bucket, db,
+                                         workers=int(os.environ.get('IMAGENES_WORKERS', 4)),
+                                         cola_maxima=int(os.environ.get('IMAGENES_COLA_MAXIMA', 100)),
+                                         al_completar=imagen_procesada)
+
+# Borra en segundo plano los blobs de las imágenes que quedan sin uso
+limpiador_storage = LimpiadorStorage(db, bucket, firestore.transactional,
+                                     workers=int(os.environ.get('LIMPIEZA_WORKERS', 4)))
+
 #Modelos para Swagger
 bien_raiz_model = api.model('BienRaiz', {
     'id': fields.String(required=True, description='ID del bien raíz'),
     'nombre': fields.String(required=True, description = 'Nombre del bien raíz'),
     'precio':fields.Float(required=True, description = 'Precio del bien raíz'),
     'ubicacion': fields.String(required=True, description='Ubicación del bien raíz'),
+    'latitud': fields.Float(required=False, description='Latitud en grados decimales'),
+    'longitud': fields.Float(required=False, description='Longitud en grados decimales'),
     'descripcion': fields.String(required=True, description='Descripción del bien raíz'),  # Nueva descripción
     'habitaciones': fields.Integer(required=True, description='Cantidad de habitaciones'),  # Nueva propiedad
     'banos': fields.Integer(required=True, description='Cantidad de baños'),  # Nueva propiedad
     'imagen_url': fields.String(required=False, description='URL de la imagen del bien raíz'),  # Campo existente
+    'imagenes': fields.Raw(required=False, description='URLs de las variantes de la imagen (miniatura, tarjeta, completa)'),
+    'imagen_estado': fields.String(required=False, description='Estado del procesamiento de la imagen (pendiente, lista, error)'),
+    'estado_venta': fields.String(required=False, description='Estado de la venta del bien raíz si ya fue vendido'),
     'vendedor_id': fields.String(required=True, description='ID del vendedor')
 })
 
@@ -59,6 +421,214 @@ venta_model = api.model('Venta', {
     'notas': fields.String(required=False, description='Notas adicionales sobre la venta')
 })
 
+# Paginación del catálogo de bienes raíces
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+# Campos que se pueden pedir con fields= (el id siempre se incluye)
+CAMPOS_BIEN_RAIZ = [campo for campo in bien_raiz_model if campo != 'id']
+# Valores por defecto cuando un documento no tiene el campo
+DEFECTOS_BIEN_RAIZ = {
+    'user_id': None,
+    'vendedor_id': 'No asignado',
+    'nombre': 'No disponible',
+    'precio': 0,
+    'ubicacion': 'No disponible',
+    'latitud': None,
+    'longitud': None,
+    'descripcion': 'No disponible',
+    'habitaciones': 0,
+    'banos': 0,
+    'imagen_url': 'No disponible',
+    'imagenes': None,
+    'imagen_estado': None,
+    'estado_venta': None
+}
+
+# Serializadores de los listados: el mismo resultado que marshal(bien_raiz_model) y que
+# serializar_bien_raiz(), respectivamente, pero armando cada fila en una sola pasada
+serializador_bienes = Serializador(bien_raiz_model, DEFECTOS_BIEN_RAIZ)
+serializador_pagina = Serializador(bien_raiz_model, DEFECTOS_BIEN_RAIZ, campos=list(DEFECTOS_BIEN_RAIZ), convertir=False)
+
+def codificar_cursor(doc_id):
+    # El cursor es opaco para el cliente: el ID del último documento en base64
+    return base64.urlsafe_b64encode(doc_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        doc_id = base64.urlsafe_b64decode(cursor + relleno).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Cursor inválido")
+    if not doc_id or '/' in doc_id:
+        raise ValueError("Cursor inválido")
+    return doc_id
+
+def parsear_campos(valor):
+    # Convierte 'nombre,precio' en una lista validada de campos
+    if not valor:
+        return None
+    campos = [campo.strip() for campo in valor.split(',') if campo.strip()]
+    desconocidos = [campo for campo in campos if campo not in CAMPOS_BIEN_RAIZ]
+    if desconocidos:
+        raise ValueError(f"Campos no válidos: {', '.join(desconocidos)}")
+    return campos
+
+def serializar_bien_raiz(doc, campos=None):
+    # Convierte un documento de Firestore en un dict aplicando los valores por defecto
+    bien = doc.to_dict() or {}
+    if campos is None:
+        campos = list(DEFECTOS_BIEN_RAIZ)
+    resultado = {'id': doc.id}
+    for campo in campos:
+        resultado[campo] = bien.get(campo, DEFECTOS_BIEN_RAIZ.get(campo))
+    return resultado
+
+def datos_ubicacion(latitud, longitud):
+    # Coordenadas y geohash a guardar; sin coordenadas el bien raíz no aparece en /bienes_raices/cercanos
+    if latitud is None and longitud is None:
+        return {}
+    validar_coordenadas(latitud, longitud)
+    return {'latitud': latitud, 'longitud': longitud, 'geohash': codificar_geohash(latitud, longitud)}
+
+# Segundos que el rol guardado en la sesión se considera válido sin volver a leer Firestore.
+# Un cambio de tipo_usuario se ve al vencer este plazo, o de inmediato con POST /sesion/refrescar
+ROL_SESION_TTL = int(os.environ.get('ROL_SESION_TTL', 900))
+
+def guardar_rol_en_sesion(user_id, tipo_usuario, nombre_completo):
+    # La sesión de Flask va firmada, así que el cliente no puede alterar el rol
+    session['user_id'] = user_id
+    session['rol'] = {
+        'tipo_usuario': tipo_usuario,
+        'nombre_completo': nombre_completo,
+        'emitido': time.time()
+    }
+
+def rol_de_sesion(user_id, refrescar=False):
+    # Devuelve el rol de la sesión; solo lee Firestore si venció o falta
+    rol = session.get('rol')
+    vigente = (rol is not None
+               and not refrescar
+               and time.time() - rol.get('emitido', 0) < ROL_SESION_TTL)
+    if vigente:
+        return rol
+
+    user_data = db.collection('user').document(user_id).get()
+    if not user_data.exists:
+        session.pop('rol', None)
+        return None
+    user_info = user_data.to_dict()
+    guardar_rol_en_sesion(user_id, user_info.get('tipo_usuario'), user_info.get('nombre_completo'))
+    return session['rol']
+
+def requiere_rol(*roles):
+    # Verifica el rol con la sesión, sin consultar Firestore en cada petición
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            user_id = session.get('user_id')
+            if not user_id:
+                return {"error": "No se encontró un usuario autenticado"}, 401
+            rol = rol_de_sesion(user_id)
+            if rol is None:
+                return {"error": "Usuario no encontrado en la base de datos"}, 404
+            if roles and rol['tipo_usuario'] not in roles:
+                return {"error": f"El usuario no tiene el rol de {' o '.join(roles)}"}, 403
+            return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+# Tamaño de página al recorrer colecciones grandes de forma perezosa
+TAMANO_PAGINA_STREAM = 500
+CAMPOS_VENTA = ['venta_id'] + list(venta_model)
+
+def iterar_paginado(query, tamano=TAMANO_PAGINA_STREAM):
+    # Recorre la consulta por páginas para no mantener abierta una sola lectura larga
+    ultimo = None
+    while True:
+        pagina = query if ultimo is None else query.start_after(ultimo)
+        docs = list(pagina.limit(tamano).stream())
+        yield from docs
+        if len(docs) < tamano:
+            return
+        ultimo = docs[-1]
+
+def parsear_fecha_limite(valor, hasta=False):
+    # Acepta 'YYYY-MM-DD' o 'YYYY-MM-DD HH:MM:SS' y devuelve (operador, valor) comparable con fecha_venta
+    for formato in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            fecha = datetime.strptime(valor, formato)
+        except ValueError:
+            continue
+        if not hasta:
+            return '>=', fecha.strftime(formato)
+        if formato == '%Y-%m-%d':
+            # Con solo la fecha se incluye el día completo
+            return '<', (fecha + timedelta(days=1)).strftime(formato)
+        return '<=', fecha.strftime(formato)
+    raise ValueError(f"Fecha inválida: {valor}. Use el formato YYYY-MM-DD o YYYY-MM-DD HH:MM:SS")
+
+# Relaciones que se pueden incrustar en /compras y /ventas con expand=:
+# nombre -> (campo de la venta con el ID, colección, campos que se devuelven)
+EXPANSIONES_VENTA = {
+    'bien_raiz': ('bien_raiz_id', 'bienes_raices',
+                  ['nombre', 'precio', 'ubicacion', 'habitaciones', 'banos', 'imagen_url', 'imagenes', 'estado_venta']),
+    'vendedor': ('vendedor_id', 'user', ['nombre_completo', 'email']),
+    'comprador': ('comprador_id', 'user', ['nombre_completo', 'email'])
+}
+# Pool para hacer en paralelo las lecturas independientes de una petición
+# (las colecciones de expand=, los rangos de geohash de la búsqueda por cercanía)
+ejecutor_consultas = ThreadPoolExecutor(max_workers=int(os.environ.get('CONSULTAS_WORKERS', 8)),
+                                        thread_name_prefix='consultas')
+
+def parsear_expansiones(valor):
+    # Convierte 'bien_raiz,vendedor' en una lista validada de relaciones
+    if not valor:
+        return []
+    expansiones = list(dict.fromkeys(nombre.strip() for nombre in valor.split(',') if nombre.strip()))
+    desconocidas = [nombre for nombre in expansiones if nombre not in EXPANSIONES_VENTA]
+    if desconocidas:
+        raise ValueError(f"Relaciones no válidas en expand: {', '.join(desconocidas)}. "
+                         f"Use {', '.join(EXPANSIONES_VENTA)}")
+    return expansiones
+
+def leer_relacionados(docs, expansiones):
+    # Junta los IDs distintos por colección y los lee con un get_all por colección.
+    # Devuelve ({(colección, id): datos proyectados}, snapshots leídos)
+    pedidos = {}
+    if expansiones:
+        for doc in docs:
+            venta = doc.to_dict()
+            for nombre in expansiones:
+                campo, coleccion, campos = EXPANSIONES_VENTA[nombre]
+                ids, proyeccion = pedidos.setdefault(coleccion, (set(), set()))
+                if venta.get(campo):
+                    ids.add(venta[campo])
+                proyeccion.update(campos)
+
+    def leer(coleccion, ids, campos):
+        refs = [db.collection(coleccion).document(doc_id) for doc_id in sorted(ids)]
+        return coleccion, list(db.get_all(refs, field_paths=sorted(campos)))
+
+    # Cada tarea corre en una copia del contexto para que sus lecturas cuenten en las métricas de la petición
+    futuros = [ejecutor_consultas.submit(contextvars.copy_context().run, leer, coleccion, ids, campos)
+               for coleccion, (ids, campos) in pedidos.items() if ids]
+    relacionados, snapshots = {}, []
+    for futuro in futuros:
+        coleccion, leidos = futuro.result()
+        for snapshot in leidos:
+            snapshots.append(snapshot)
+            if snapshot.exists:
+                relacionados[(coleccion, snapshot.id)] = dict(snapshot.to_dict() or {}, id=snapshot.id)
+    return relacionados, snapshots
+
+def incrustar_relacionados(fila, venta, expansiones, relacionados):
+    # Agrega a la fila los campos proyectados de cada relación pedida (None si ya no existe)
+    for nombre in expansiones:
+        campo, coleccion, campos = EXPANSIONES_VENTA[nombre]
+        datos = relacionados.get((coleccion, venta.get(campo)))
+        fila[nombre] = None if datos is None else {clave: datos.get(clave) for clave in ['id'] + campos}
+    return fila
+
 @api.route('/login')
 class Login(Resource):
     @api.doc(description="Iniciar sesión con email y contraseña")
@@ -81,6 +651,7 @@ class Login(Resource):
                 nombre_completo = user_info.get('nombre_completo')
                 tipo_usuario = user_info.get('tipo_usuario')
                 password = user_info.get('password')
+                guardar_rol_en_sesion(user.uid, tipo_usuario, nombre_completo)
                 return{"message": "Inicio de sesion exitoso", 
                        "id": user.uid,
                        "email": email,
@@ -118,7 +689,7 @@ class Signup(Resource):
                 'tipo_usuario':tipo_usuario,
                 'password': password
             })
-            session['user_id'] = user.uid
+            guardar_rol_en_sesion(user.uid, tipo_usuario, nombre_completo)
             return {"message": "Registro exitoso", "tipo_usuario": tipo_usuario}, 201
         except Exception as e:
             return {"error": str(e)}, 400
@@ -130,33 +701,79 @@ class BienesRaices(Resource):
     bien_raiz_parser.add_argument('nombre', type=str, required=True, help='Nombre del bien raíz')
     bien_raiz_parser.add_argument('precio', type=float, required=True, help='Precio del bien raíz')
     bien_raiz_parser.add_argument('ubicacion', type=str, required=True, help='Ubicación del bien raíz')
+    bien_raiz_parser.add_argument('latitud', type=float, required=False, help='Latitud en grados decimales (opcional, junto con longitud)')
+    bien_raiz_parser.add_argument('longitud', type=float, required=False, help='Longitud en grados decimales (opcional, junto con latitud)')
     bien_raiz_parser.add_argument('descripcion', type=str, required=True, help='Descripción del bien raíz')
     bien_raiz_parser.add_argument('habitaciones', type=int, required=True, help='Cantidad de habitaciones')
     bien_raiz_parser.add_argument('banos', type=int, required=True, help='Cantidad de baños')
     bien_raiz_parser.add_argument('imagen', type=FileStorage, location='files', required=True, help='Imagen del bien raíz')
 
-    @api.marshal_list_with(bien_raiz_model)
-    @api.doc(description="Obtener todos los bienes raíces")
+    # Parámetros de paginación y proyección para el listado
+    listado_parser = api.parser()
+    listado_parser.add_argument('limit', type=inputs.int_range(1, LIMITE_MAXIMO), location='args', help=f'Cantidad de bienes raíces por página (máximo {LIMITE_MAXIMO})')
+    listado_parser.add_argument('cursor', type=str, location='args', help='Cursor opaco devuelto en next_cursor')
+    listado_parser.add_argument('fields', type=str, location='args', help='Campos a devolver separados por coma (ej. nombre,precio)')
+    listado_parser.add_argument('todos', type=inputs.boolean, location='args', default=False, help='Devolver el catálogo completo sin paginar, como una lista')
+
+    @api.expect(listado_parser)
+    @api.response(200, 'Con todos=true, el catálogo completo como lista', [bien_raiz_model])
+    @api.doc(description="Obtener los bienes raíces de a una página, como {'bienes_raices': [...], 'next_cursor': ...}. "
+                         f"Sin limit se devuelven {LIMITE_POR_DEFECTO}. Con todos=true se devuelve el catálogo completo "
+                         "como lista, como antes de la paginación")
     def get(self):
-        bienes_raices = []
-        docs = db.collection('bienes_raices').stream()
+        args = self.listado_parser.parse_args()
+        try:
+            campos = parsear_campos(args['fields'])
+            cursor_id = decodificar_cursor(args['cursor']) if args['cursor'] else None
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        for doc in docs:
-            bien = doc.to_dict()
-            bien['id'] = doc.id  # Obtiene el ID de Firestore
-            bienes_raices.append({
-                'id': bien['id'],
-                'user_id': bien.get('user_id'),
-                'vendedor_id': bien.get('vendedor_id', 'No asignado'),
-                'nombre': bien.get('nombre', 'No disponible'),
-                'precio': bien.get('precio', 0),
-                'ubicacion': bien.get('ubicacion', 'No disponible'),
-                'descripcion': bien.get('descripcion', 'No disponible'),
-                'habitaciones': bien.get('habitaciones', 0),
-                'banos': bien.get('banos', 0),
-                'imagen_url': bien.get('imagen_url', 'No disponible')
-            })
-        return bienes_raices, 200
+        if args['todos']:
+            if args['limit'] is not None or cursor_id is not None or campos is not None:
+                return {"error": "todos=true no se puede combinar con limit, cursor ni fields"}, 400
+            clave = f"bienes_raices:v{cache.version('bienes_raices')}:todos"
+            cargado = cache.obtener(clave, self.cargar_catalogo)
+        else:
+            limite = args['limit'] or LIMITE_POR_DEFECTO
+            clave = (f"bienes_raices:v{cache.version('bienes_raices')}:"
+                     f"{limite}:{cursor_id or ''}:{','.join(campos or [])}")
+            cargado = cache.obtener(clave, lambda: self.cargar_pagina(limite, cursor_id, campos))
+
+        # La caché guarda el JSON ya codificado junto con su ETag: un acierto no vuelve a serializar
+        no_modificada = respuesta_no_modificada(cargado['etag'])
+        if no_modificada is not None:
+            return no_modificada
+        return Response(cargado['json'], status=200, mimetype='application/json',
+                        headers=encabezados_etag(cargado['etag']))
+
+    @staticmethod
+    def cargar_catalogo():
+        # Comportamiento original: todo el catálogo en una lista
+        docs = list(db.collection('bienes_raices').stream())
+        cuerpo = codificar_json(serializador_bienes.filas(docs)).decode('utf-8')
+        return {'json': cuerpo, 'etag': etag_documentos(docs, 'todos')}
+
+    @staticmethod
+    def cargar_pagina(limite, cursor_id, campos):
+        # Se ordena por el ID del documento para que el cursor sea estable
+        query = db.collection('bienes_raices').order_by('__name__')
+        if campos is not None:
+            query = query.select(campos)
+        if cursor_id is not None:
+            query = query.start_after({'__name__': cursor_id})
+
+        # Se pide un documento extra para saber si hay una página siguiente
+        docs = list(query.limit(limite + 1).stream())
+        hay_mas = len(docs) > limite
+
+        serializador = serializador_pagina if campos is None else Serializador(
+            bien_raiz_model, DEFECTOS_BIEN_RAIZ, campos=campos, convertir=False)
+        bienes_raices = serializador.filas(docs[:limite])
+        next_cursor = codificar_cursor(docs[limite - 1].id) if hay_mas else None
+        # El documento extra entra en el ETag para que cambie también next_cursor
+        etag = etag_documentos(docs, limite, cursor_id or '', ','.join(campos or []))
+        cuerpo = codificar_json({"bienes_raices": bienes_raices, "next_cursor": next_cursor}).decode('utf-8')
+        return {'json': cuerpo, 'etag': etag}
 
     @api.doc(description="Agregar un nuevo bien raíz")
     @api.expect(bien_raiz_parser)
@@ -173,40 +790,530 @@ class BienesRaices(Resource):
             return{"error": "No se encontró un usuario autenticado"}, 401
 
         try:
-            # Obtener el nombre del archivo de imagen
-            file_name = secure_filename(imagen.filename)
-            content_type = imagen.content_type
-
-            # Crear una referencia en el bucket de Firebase Storage
-            blob = bucket.blob(file_name)
-
-            # Subir el archivo de imagen al bucket
-            blob.upload_from_file(imagen, content_type=content_type)
+            ubicacion = datos_ubicacion(args['latitud'], args['longitud'])
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-            # Hacer que el archivo sea accesible públicamente
-            blob.make_public()
+        if procesador_imagenes.saturado():
+            return {"error": "Hay demasiadas imágenes en proceso, intente nuevamente en unos segundos"}, 503
 
-            # Obtener la URL pública de la imagen
-            imagen_url = f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{file_name}?alt=media"
+        try:
+            # El hash se calcula mientras se lee el archivo, sin cargarlo completo en memoria
+            imagen_hash, archivo, tamano = hashear_archivo(imagen.stream)
+            content_type = imagen.content_type
 
-            # Registrar el bien raíz en Firestore con la URL de la imagen
-            doc_ref = db.collection('bienes_raices').add({
+            # Registrar el bien raíz en Firestore; la URL de la imagen se agrega al terminar el procesamiento
+            datos_bien = {
                 'nombre': args['nombre'],
                 'precio': args['precio'],
                 'ubicacion': args['ubicacion'],
                 'descripcion': args['descripcion'],
                 'habitaciones': args['habitaciones'],
                 'banos': args['banos'],
-                'imagen_url': imagen_url,  # Guardar la URL pública
+                'imagen_hash': imagen_hash,
+                'imagen_estado': 'pendiente',
                 'vendedor_id': vendedor_id
-            })
+            }
+            datos_bien.update(ubicacion)
+            bien_ref = db.collection('bienes_raices').document()
+            imagen_ref = db.collection(COLECCION_IMAGENES).document(imagen_hash)
+            try:
+                datos_bien, procesar = crear_bien_raiz_con_imagen(db.transaction(), bien_ref, imagen_ref, datos_bien, {
+                    'content_type': content_type,
+                    'tamano': tamano,
+                    'nombre_original': secure_filename(imagen.filename or '')
+                })
+            except ImagenEnEliminacion as e:
+                archivo.close()
+                return {"error": str(e)}, 409
+
+            bien_id = bien_ref.id  # Obtener el ID del documento creado
+            invalidar_bien_raiz()
+            indice_bienes.agregar(bien_id, datos_bien)
+
+            error_imagen = None
+            if not procesar:
+                # La imagen ya existe (o se está procesando): no se vuelve a subir
+                archivo.close()
+                procesador_imagenes.contar_reutilizada()
+            else:
+                try:
+                    # El original queda en Storage antes de responder; el pool solo genera las variantes
+                    procesador_imagenes.guardar_original(imagen_hash, archivo, content_type)
+                    procesador_imagenes.encolar(imagen_hash, content_type)
+                except Exception as e:
+                    # El bien raíz ya quedó creado: se responde 202 con la imagen en error para que el
+                    # cliente no lo vuelva a crear; la próxima subida del mismo archivo la reprocesa
+                    logging.exception("No se pudo guardar o encolar la imagen %s", imagen_hash)
+                    marcar_imagen_con_error(imagen_hash, [bien_id])
+                    datos_bien['imagen_estado'] = 'error'
+                    error_imagen = str(e)
+
+            respuesta = {"message": "Bien raíz agregado", "id": bien_id, "vendedor_id": vendedor_id,
+                         "imagen_estado": datos_bien['imagen_estado']}
+            if error_imagen is not None:
+                respuesta.update(message="Bien raíz agregado, pero no se pudo procesar la imagen; vuelva a subirla",
+                                 error_imagen=error_imagen)
+                return respuesta, 202
+            if datos_bien['imagen_estado'] == 'lista':
+                respuesta['imagen_url'] = datos_bien['imagen_url']
+                return respuesta, 201
+            respuesta['message'] = "Bien raíz agregado, la imagen se está procesando"
+            return respuesta, 202
 
-            bien_id = doc_ref.id  # Obtener el ID del documento creado
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+# Importación masiva: cada lote se confirma en una transacción de hasta 500 escrituras,
+# una por fila, una por imagen distinta y una para el progreso
+LIMITE_LOTE = 500
+
+@firestore.transactional
+def confirmar_lote_importacion(transaccion, progreso_ref, progreso, filas, metadatos):
+    # Reserva las imágenes del lote, crea sus bienes raíces y guarda el progreso en un solo commit:
+    # una importación reanudada nunca salta filas cuyas imágenes no se contaron.
+    # Devuelve (filas creadas, filas rechazadas con su error, hashes a procesar)
+    por_hash = {}
+    for _, _, datos in filas:
+        if 'imagen_hash' in datos:
+            por_hash[datos['imagen_hash']] = por_hash.get(datos['imagen_hash'], 0) + 1
+    imagen_refs = [db.collection(COLECCION_IMAGENES).document(imagen_hash) for imagen_hash in por_hash]
+    registros = {}
+    if imagen_refs:
+        registros = {registro.id: registro for registro in db.get_all(imagen_refs, transaction=transaccion)}
+
+    listas, procesar, rechazadas = {}, [], {}
+    for imagen_ref in imagen_refs:
+        try:
+            nueva, variantes = sumar_referencias_imagen(transaccion, imagen_ref, por_hash[imagen_ref.id],
+                                                        metadatos[imagen_ref.id], registros[imagen_ref.id])
+        except ImagenEnEliminacion as e:
+            rechazadas[imagen_ref.id] = str(e)
+            continue
+        if variantes is not None:
+            listas[imagen_ref.id] = variantes
+        elif nueva:
+            procesar.append(imagen_ref.id)
+
+    creadas, rechazadas_filas = [], []
+    for numero, doc_id, datos in filas:
+        imagen_hash = datos.get('imagen_hash')
+        if imagen_hash in rechazadas:
+            rechazadas_filas.append((numero, f"imagen: {rechazadas[imagen_hash]}"))
+            continue
+        datos = dict(datos)
+        if imagen_hash in listas:
+            datos.update(datos_imagen_lista(listas[imagen_hash]))
+        transaccion.set(db.collection('bienes_raices').document(doc_id), datos)
+        creadas.append((numero, doc_id, datos))
+    transaccion.set(progreso_ref, progreso, merge=True)
+    return creadas, rechazadas_filas, procesar
+
+def leer_filas(flujo, formato):
+    # Lee el cuerpo línea por línea sin cargarlo completo; devuelve (fila, error) por cada registro
+    lineas = codecs.iterdecode(flujo, 'utf-8-sig')
+    if formato == 'csv':
+        for fila in csv.DictReader(lineas):
+            yield fila, None
+        return
+    for linea in lineas:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield None, f"JSON inválido: {e}"
+            continue
+        if not isinstance(fila, dict):
+            yield None, "Cada línea debe ser un objeto JSON"
+            continue
+        yield fila, None
+
+def validar_fila(fila):
+    # Aplica las mismas reglas que bien_raiz_parser (salvo la imagen, que viene en el archivo comprimido)
+    datos, errores = {}, []
+    for argumento in BienesRaices.bien_raiz_parser.args:
+        if argumento.location == 'files':
+            continue
+        valor = fila.get(argumento.name)
+        if valor is None or (isinstance(valor, str) and not valor.strip()):
+            if argumento.required:
+                errores.append(f"{argumento.name}: {argumento.help} es requerido")
+            continue
+        try:
+            datos[argumento.name] = argumento.type(valor)
+        except (TypeError, ValueError):
+            errores.append(f"{argumento.name}: valor inválido '{valor}'")
+    return datos, errores
+
+@api.route('/bienes_raices/importar')
+class ImportarBienesRaices(Resource):
+    importar_parser = api.parser()
+    importar_parser.add_argument('datos', type=FileStorage, location='files', help='Archivo CSV o NDJSON con los bienes raíces (si no se envía, se lee el cuerpo de la petición)')
+    importar_parser.add_argument('imagenes', type=FileStorage, location='files', help='Archivo ZIP con las imágenes referenciadas en la columna imagen')
+    importar_parser.add_argument('formato', type=str, location='args', choices=('csv', 'ndjson'), help='Formato de los datos (por defecto se deduce del archivo o del Content-Type)')
+    importar_parser.add_argument('importacion_id', type=str, location='args', help='ID de una importación interrumpida para reanudarla')
+
+    @api.expect(importar_parser)
+    @api.doc(description="Importar bienes raíces en lote desde CSV o NDJSON, con un ZIP opcional de imágenes. "
+                         "Devuelve el resultado de cada fila; con importacion_id se reanuda una importación interrumpida")
+    @requiere_rol('vendedor')
+    def post(self):
+        args = self.importar_parser.parse_args()
+        vendedor_id = session.get('user_id')
 
-            return {"message": "Bien raíz agregado", "id": bien_id,"vendedor_id": vendedor_id,"imagen_url": imagen_url}, 201
+        datos = args['datos']
+        flujo = datos.stream if datos is not None else request.stream
+        formato = args['formato']
+        if formato is None:
+            nombre = (datos.filename or '') if datos is not None else ''
+            tipo = datos.mimetype if datos is not None else request.mimetype
+            formato = 'csv' if nombre.lower().endswith('.csv') or tipo == 'text/csv' else 'ndjson'
+
+        archivo_imagenes = None
+        if args['imagenes'] is not None:
+            try:
+                archivo_imagenes = zipfile.ZipFile(args['imagenes'].stream)
+            except zipfile.BadZipFile:
+                return {"error": "El archivo de imágenes no es un ZIP válido"}, 400
+
+        importacion_id = args['importacion_id'] or uuid.uuid4().hex
+        if '/' in importacion_id:
+            return {"error": "ID de importación inválido"}, 400
+        progreso_ref = db.collection('importaciones').document(importacion_id)
+        progreso = progreso_ref.get()
+        ultima_fila = 0
+        if progreso.exists:
+            progreso_data = progreso.to_dict()
+            if progreso_data.get('vendedor_id') != vendedor_id:
+                return {"error": "La importación pertenece a otro usuario"}, 403
+            ultima_fila = progreso_data.get('ultima_fila', 0)
+
+        importacion = Importacion(importacion_id, progreso_ref, vendedor_id, archivo_imagenes)
+        try:
+            for numero, (fila, error) in enumerate(leer_filas(flujo, formato), start=1):
+                if numero <= ultima_fila:
+                    # Ya se confirmó en un intento anterior
+                    importacion.resultados.append({'fila': numero, 'estado': 'omitida'})
+                    continue
+                importacion.agregar_fila(numero, fila, error)
+            importacion.confirmar()
+        except Exception as e:
+            logging.exception("Error en la importación %s", importacion_id)
+            return {"error": str(e), "importacion_id": importacion_id,
+                    "ultima_fila": importacion.ultima_confirmada or ultima_fila}, 500
+        finally:
+            if archivo_imagenes is not None:
+                archivo_imagenes.close()
+
+        resultados = importacion.resultados
+        return {
+            "importacion_id": importacion_id,
+            "creadas": sum(1 for r in resultados if r['estado'] == 'creada'),
+            "omitidas": sum(1 for r in resultados if r['estado'] == 'omitida'),
+            "errores": sum(1 for r in resultados if r['estado'] == 'error'),
+            "ultima_fila": importacion.ultima_confirmada or ultima_fila,
+            "filas": sorted(resultados, key=lambda r: r['fila'])
+        }, 200
+
+class Importacion:
+    # Acumula las filas válidas y las confirma en lotes junto con el progreso
+
+    def __init__(self, importacion_id, progreso_ref, vendedor_id, archivo_imagenes=None):
+        self.importacion_id = importacion_id
+        self.progreso_ref = progreso_ref
+        self.vendedor_id = vendedor_id
+        self.archivo_imagenes = archivo_imagenes
+        self.miembros = {}
+        if archivo_imagenes is not None:
+            self.miembros = {os.path.basename(nombre): nombre for nombre in archivo_imagenes.namelist()
+                             if not nombre.endswith('/')}
+        self.hashes = {}  # nombre en el ZIP -> (hash, tamaño, miembro)
+        self.lote = []
+        self.hashes_lote = set()
+        self.resultados = []
+        self.ultima_leida = 0
+        self.ultima_confirmada = None
+
+    def agregar_fila(self, numero, fila, error=None):
+        self.ultima_leida = numero
+        errores = [error] if error else []
+        datos = {}
+        if fila is not None:
+            datos, errores = validar_fila(fila)
+            if not errores:
+                try:
+                    datos.update(datos_ubicacion(datos.pop('latitud', None), datos.pop('longitud', None)))
+                except ValueError as e:
+                    errores.append(f"ubicación: {e}")
+            nombre_imagen = (fila.get('imagen') or '').strip()
+            if nombre_imagen and not errores:
+                try:
+                    imagen_hash = self.hashear_imagen(nombre_imagen)
+                    datos.update(imagen_hash=imagen_hash, imagen_estado='pendiente')
+                except KeyError:
+                    errores.append(f"imagen: '{nombre_imagen}' no está en el archivo de imágenes")
+        if errores:
+            self.resultados.append({'fila': numero, 'estado': 'error', 'errores': errores})
+        else:
+            datos['vendedor_id'] = self.vendedor_id
+            # El ID depende de la fila, así reintentar la importación no duplica documentos
+            self.lote.append((numero, f'{self.importacion_id}-{numero}', datos))
+            if 'imagen_hash' in datos:
+                self.hashes_lote.add(datos['imagen_hash'])
+        # Se deja lugar para la próxima fila, su imagen y el progreso
+        if len(self.lote) + len(self.hashes_lote) + 3 > LIMITE_LOTE:
+            self.confirmar()
+
+    def hashear_imagen(self, nombre):
+        if nombre not in self.hashes:
+            miembro = self.miembros[os.path.basename(nombre)]
+            with self.archivo_imagenes.open(miembro) as contenido:
+                imagen_hash, archivo, tamano = hashear_archivo(contenido)
+            archivo.close()
+            self.hashes[nombre] = (imagen_hash, tamano, miembro)
+        return self.hashes[nombre][0]
+
+    def confirmar(self):
+        if self.ultima_leida == (self.ultima_confirmada or 0):
+            return
+        miembros = {imagen_hash: (tamano, miembro) for imagen_hash, tamano, miembro in self.hashes.values()}
+        metadatos = {imagen_hash: {
+            'content_type': None,
+            'tamano': miembros[imagen_hash][0],
+            'nombre_original': secure_filename(os.path.basename(miembros[imagen_hash][1]))
+        } for imagen_hash in self.hashes_lote}
+        progreso = {
+            'vendedor_id': self.vendedor_id,
+            'ultima_fila': self.ultima_leida,
+            'actualizado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        creadas, rechazadas, procesar = confirmar_lote_importacion(
+            db.transaction(), self.progreso_ref, progreso, self.lote, metadatos)
+        self.ultima_confirmada = self.ultima_leida
+        self.lote = []
+        self.hashes_lote = set()
+
+        invalidar_bien_raiz()
+        por_hash = {}
+        for _, doc_id, datos in creadas:
+            indice_bienes.agregar(doc_id, datos)
+            if 'imagen_hash' in datos:
+                por_hash.setdefault(datos['imagen_hash'], []).append(doc_id)
+        fallidas = self.procesar_imagenes(procesar, por_hash, miembros)
+        for numero, doc_id, datos in creadas:
+            resultado = {'fila': numero, 'estado': 'creada', 'id': doc_id}
+            if datos.get('imagen_hash') in fallidas:
+                resultado['imagen_estado'] = 'error'
+            self.resultados.append(resultado)
+        for numero, error in rechazadas:
+            self.resultados.append({'fila': numero, 'estado': 'error', 'errores': [error]})
+
+    def procesar_imagenes(self, procesar, por_hash, miembros):
+        # Sube los originales de las imágenes nuevas del lote en paralelo y las encola; las referencias
+        # ya se sumaron al confirmarlo. Devuelve los hashes que fallaron, ya marcados con error
+        for imagen_hash in por_hash:
+            if imagen_hash not in procesar:
+                procesador_imagenes.contar_reutilizada()
+        originales, fallidas = {}, set()
+        try:
+            for imagen_hash in procesar:
+                with self.archivo_imagenes.open(miembros[imagen_hash][1]) as contenido:
+                    _, archivo, _ = hashear_archivo(contenido)
+                originales[imagen_hash] = (archivo, None)
+            fallidas.update(procesador_imagenes.guardar_originales(originales))
+        except Exception:
+            logging.exception("No se pudieron leer las imágenes del lote de la importación %s", self.importacion_id)
+            for archivo, _ in originales.values():
+                archivo.close()
+            fallidas.update(procesar)
+        for imagen_hash in procesar:
+            if imagen_hash in fallidas:
+                continue
+            try:
+                # Se espera lugar en la cola en vez de rechazar la imagen
+                procesador_imagenes.encolar(imagen_hash, esperar=True)
+            except Exception:
+                logging.exception("No se pudo encolar la imagen %s", imagen_hash)
+                fallidas.add(imagen_hash)
+        for imagen_hash in fallidas:
+            marcar_imagen_con_error(imagen_hash, por_hash.get(imagen_hash, []))
+        return fallidas
+
+@api.route('/bienes_raices/eliminar')
+class EliminarBienesRaices(Resource):
+    @api.expect(api.model('EliminarBienesRaices', {
+        'ids': fields.List(fields.String, required=False, description='IDs de los bienes raíces a eliminar'),
+        'vendedor_id': fields.String(required=False, description='Eliminar todos los bienes raíces de este vendedor')
+    }))
+    @api.doc(description="Eliminar varios bienes raíces del vendedor autenticado, por lista de IDs o todo su inventario. "
+                         "Las imágenes que quedan sin uso se borran en segundo plano")
+    @requiere_rol('vendedor')
+    def post(self):
+        data = request.get_json(silent=True) or {}
+        vendedor_id = session.get('user_id')
+        ids = data.get('ids')
+        if data.get('vendedor_id'):
+            if data['vendedor_id'] != vendedor_id:
+                return {"error": "Solo se puede eliminar el inventario propio"}, 403
+            # Solo se leen los IDs, no el contenido de los documentos
+            query = db.collection('bienes_raices').where('vendedor_id', '==', vendedor_id).order_by('__name__').select([])
+            ids = [doc.id for doc in iterar_paginado(query)]
+        elif not isinstance(ids, list) or not all(isinstance(bien_id, str) and bien_id for bien_id in ids):
+            return {"error": "Se debe proporcionar una lista de IDs o el vendedor_id"}, 400
 
+        try:
+            eliminados, rechazados = eliminar_bienes_raices(ids, vendedor_id)
         except Exception as e:
             return {"error": str(e)}, 500
+
+        procesados = set(eliminados) | set(rechazados)
+        return {
+            "message": "Bienes raíces eliminados",
+            "eliminados": eliminados,
+            "no_autorizados": rechazados,
+            "no_encontrados": [bien_id for bien_id in dict.fromkeys(ids) if bien_id not in procesados]
+        }, 200
+
+@api.route('/bienes_raices/buscar')
+class BuscarBienesRaices(Resource):
+    busqueda_parser = api.parser()
+    busqueda_parser.add_argument('q', type=str, location='args', help='Texto a buscar en nombre, descripción y ubicación')
+    busqueda_parser.add_argument('precio_min', type=float, location='args', help='Precio mínimo')
+    busqueda_parser.add_argument('precio_max', type=float, location='args', help='Precio máximo')
+    busqueda_parser.add_argument('habitaciones_min', type=int, location='args', help='Cantidad mínima de habitaciones')
+    busqueda_parser.add_argument('banos_min', type=int, location='args', help='Cantidad mínima de baños')
+    busqueda_parser.add_argument('ordenar', type=str, location='args', choices=CAMPOS_ORDENABLES, help='Campo por el que se ordena')
+    busqueda_parser.add_argument('orden', type=str, location='args', choices=('asc', 'desc'), default='asc', help='Dirección del orden')
+    busqueda_parser.add_argument('limit', type=inputs.int_range(1, LIMITE_MAXIMO), location='args', default=LIMITE_POR_DEFECTO, help='Cantidad de resultados por página')
+    busqueda_parser.add_argument('offset', type=inputs.natural, location='args', default=0, help='Cantidad de resultados a saltar')
+
+    @api.expect(busqueda_parser)
+    @api.doc(description="Buscar bienes raíces por precio, habitaciones, baños y texto sin leer Firestore")
+    def get(self):
+        args = self.busqueda_parser.parse_args()
+        try:
+            if _listener['pid'] == os.getpid():
+                # El listener mantiene el índice al día
+                indice_bienes.asegurar_cargado(documentos_bienes_raices)
+            else:
+                indice_bienes.asegurar_cargado(documentos_bienes_raices, version=cache.version('bienes_raices'),
+                                               antiguedad_maxima=INDICE_TTL, intervalo_minimo=INDICE_INTERVALO_MINIMO)
+        except Exception as e:
+            return {"error": f"No se pudo cargar el índice de búsqueda: {str(e)}"}, 500
+
+        total, resultados = indice_bienes.buscar(
+            texto=args['q'],
+            precio_min=args['precio_min'],
+            precio_max=args['precio_max'],
+            habitaciones_min=args['habitaciones_min'],
+            banos_min=args['banos_min'],
+            ordenar=args['ordenar'],
+            descendente=args['orden'] == 'desc',
+            offset=args['offset'],
+            limite=args['limit'])
+        return {
+            "total": total,
+            "offset": args['offset'],
+            "limit": args['limit'],
+            "resultados": [serializador_bienes.fila(bien['id'], bien) for bien in resultados]
+        }, 200
+
+# Límites de la búsqueda por cercanía
+RADIO_MAXIMO_KM = 100
+# Un bbox no puede abarcar más que el rectángulo del radio máximo
+DIAGONAL_MAXIMA_KM = 2 * RADIO_MAXIMO_KM
+LIMITE_CERCANOS = 50
+LIMITE_CERCANOS_MAXIMO = 500
+
+def parsear_bbox(valor):
+    # Convierte 'lat_min,lng_min,lat_max,lng_max' en una tupla validada
+    try:
+        lat_min, lng_min, lat_max, lng_max = (float(parte) for parte in valor.split(','))
+    except ValueError:
+        raise ValueError("bbox debe tener el formato lat_min,lng_min,lat_max,lng_max")
+    validar_coordenadas(lat_min, lng_min)
+    validar_coordenadas(lat_max, lng_max)
+    if lat_min > lat_max:
+        raise ValueError("En bbox lat_min debe ser menor o igual que lat_max")
+    # lng_min > lng_max indica un rectángulo que cruza el antimeridiano
+    rectangulo = (lat_min, lng_min, lat_max, lng_max)
+    if diagonal_km(rectangulo) > DIAGONAL_MAXIMA_KM:
+        raise ValueError(f"bbox es demasiado grande: su diagonal puede medir como máximo {DIAGONAL_MAXIMA_KM} km")
+    return rectangulo
+
+def leer_rango_geohash(inicio, fin):
+    query = (db.collection('bienes_raices')
+             .where('geohash', '>=', inicio)
+             .where('geohash', '<', fin))
+    return list(query.stream())
+
+@api.route('/bienes_raices/cercanos')
+class BienesRaicesCercanos(Resource):
+    cercanos_parser = api.parser()
+    cercanos_parser.add_argument('latitud', type=float, location='args', help='Latitud del centro de la búsqueda')
+    cercanos_parser.add_argument('longitud', type=float, location='args', help='Longitud del centro de la búsqueda')
+    cercanos_parser.add_argument('radio_km', type=float, location='args', help=f'Radio en kilómetros (máximo {RADIO_MAXIMO_KM})')
+    cercanos_parser.add_argument('bbox', type=str, location='args', help=f'Rectángulo lat_min,lng_min,lat_max,lng_max (en lugar del radio), con una diagonal de hasta {DIAGONAL_MAXIMA_KM} km')
+    cercanos_parser.add_argument('limit', type=inputs.int_range(1, LIMITE_CERCANOS_MAXIMO), location='args', default=LIMITE_CERCANOS, help='Cantidad máxima de resultados')
+
+    @api.expect(cercanos_parser)
+    @api.doc(description="Buscar los bienes raíces dentro de un radio o de un rectángulo, ordenados por distancia. "
+                         "Solo se leen los documentos de las celdas de geohash que cubren el área")
+    def get(self):
+        args = self.cercanos_parser.parse_args()
+        latitud, longitud = args['latitud'], args['longitud']
+        try:
+            if args['bbox']:
+                rectangulo = parsear_bbox(args['bbox'])
+                if latitud is None and longitud is None:
+                    # Sin centro explícito se ordena por distancia al centro del rectángulo
+                    lat_min, lng_min, lat_max, lng_max = rectangulo
+                    ancho = (lng_max - lng_min) % 360
+                    latitud, longitud = (lat_min + lat_max) / 2, (lng_min + ancho / 2 + 180) % 360 - 180
+                else:
+                    validar_coordenadas(latitud, longitud)
+                cumple = lambda lat, lng: dentro_del_rectangulo(lat, lng, rectangulo)
+            elif args['radio_km'] is not None:
+                validar_coordenadas(latitud, longitud)
+                radio = args['radio_km']
+                if not 0 < radio <= RADIO_MAXIMO_KM:
+                    raise ValueError(f"radio_km debe ser mayor que 0 y como máximo {RADIO_MAXIMO_KM}")
+                rectangulo = rectangulo_de_radio(latitud, longitud, radio)
+                cumple = lambda lat, lng: distancia_km(latitud, longitud, lat, lng) <= radio
+            else:
+                raise ValueError("Se debe indicar latitud, longitud y radio_km, o bbox")
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        # Cada rango de geohash es una consulta; se hacen en paralelo
+        rangos = rangos_de_celdas(celdas_del_rectangulo(rectangulo))
+        futuros = [ejecutor_consultas.submit(contextvars.copy_context().run, leer_rango_geohash, inicio, fin)
+                   for inicio, fin in rangos]
+
+        resultados, vistos = [], set()
+        for futuro in futuros:
+            for doc in futuro.result():
+                if doc.id in vistos:
+                    continue
+                vistos.add(doc.id)
+                bien = serializar_bien_raiz(doc)
+                if bien['latitud'] is None or bien['longitud'] is None:
+                    continue
+                # Las celdas cubren más área que la pedida: se filtra con las coordenadas exactas
+                if not cumple(bien['latitud'], bien['longitud']):
+                    continue
+                bien['distancia_km'] = round(distancia_km(latitud, longitud, bien['latitud'], bien['longitud']), 3)
+                resultados.append(bien)
+
+        resultados.sort(key=lambda bien: bien['distancia_km'])
+        return {
+            "total": len(resultados),
+            "consultas": len(rangos),
+            "bienes_raices": resultados[:args['limit']]
+        }, 200
+
 @api.route('/bienes_raices/string<string:id>')
 class BienRaizDetail(Resource):
     @api.expect(bien_raiz_model)
@@ -233,6 +1340,8 @@ class BienRaizDetail(Resource):
             doc_ref.update({
                 'vendedor_id': nuevo_vendedor_id
             })
+            invalidar_bien_raiz(id)
+            indice_bienes.actualizar(id, {'vendedor_id': nuevo_vendedor_id})
             
             return {"message": "ID de vendedor actualizado exitosamente"}, 200
         
@@ -244,7 +1353,7 @@ class BienRaizDetail(Resource):
     def delete(self, id):
         try:
             # Eliminar el bien raíz de Firestore
-            db.collection('bienes_raices').document(id).delete()
+            eliminar_bienes_raices([id])
             return {"message": "Bien raíz eliminado exitosamente"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
@@ -299,68 +1408,73 @@ class GenerarVenta(Resource):
     
     @api.expect(venta_parser)
     @api.doc(description="Generar una venta")
+    @requiere_rol('comprador')
     def post(self):
         args = self.venta_parser.parse_args()
 
-        # Obtener el user_id desde la sesión (esto debe ser parte de tu sistema de autenticación)
+        # El decorador ya verificó la sesión y que el usuario sea comprador
         user_id = session.get('user_id')
-        if not user_id:
-            return {"error": "No se encontró un usuario autenticado"}, 401
-        
-        try:
-            # Obtener los datos del usuario desde Firestore para determinar su rol
-            user_ref = db.collection('user').document(user_id)
-            user_data = user_ref.get().to_dict()
-
-            if not user_data:
-                return {"error": "Usuario no encontrado en la base de datos"}, 404
-
-            # Verificar que el usuario autenticado sea un comprador
-            if user_data['tipo_usuario'] != 'comprador':
-                return {"error": "El usuario no tiene el rol de comprador"}, 403
-
-            comprador_id = user_id  # El comprador es el usuario autenticado
-
-            # Validar que el bien raíz existe
-            bien_raiz_ref = db.collection('bienes_raices').document(args['bien_raiz_id'])
-            bien_raiz_data = bien_raiz_ref.get().to_dict()
-
-            if not bien_raiz_data:
-                return {"error": "El bien raíz no existe"}, 404
-
-            vendedor_id = bien_raiz_data.get('vendedor_id')  # Obtener el vendedor asociado al bien raíz
-
-            if not vendedor_id:
-                return {"error": "No se ha asignado un vendedor a este bien raíz"}, 404
 
+        try:
             # Obtener la fecha de la venta (si no se proporciona, se usa la fecha actual)
-            fecha_venta = args.get('fecha_venta', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-
-            # Registrar la venta en Firestore
-            venta_ref = db.collection('ventas').add({
-                'bien_raiz_id': args['bien_raiz_id'],
-                'comprador_id': comprador_id,
-                'vendedor_id': vendedor_id,
-                'fecha_venta': fecha_venta,
-                'precio_final': args['precio_final'],
-                'forma_pago': args['forma_pago'],
-                'estado': args['estado'],
-            })
+            fecha_venta = args.get('fecha_venta') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-            return {"message": "Venta registrada exitosamente", "venta_id": venta_ref[1].id}, 201
+            bien_raiz_ref = db.collection('bienes_raices').document(args['bien_raiz_id'])
+            venta_ref = db.collection('ventas').document()
+            try:
+                registrar_venta(db.transaction(max_attempts=VENTA_MAX_INTENTOS), bien_raiz_ref, venta_ref, {
+                    'bien_raiz_id': args['bien_raiz_id'],
+                    'comprador_id': user_id,  # El comprador es el usuario autenticado
+                    'fecha_venta': fecha_venta,
+                    'precio_final': args['precio_final'],
+                    'forma_pago': args['forma_pago'],
+                    'estado': args['estado'],
+                })
+            except ErrorVenta as e:
+                return {"error": str(e)}, e.codigo
+            except ValueError:
+                # Se agotaron los reintentos por contención sobre el mismo bien raíz
+                return {"error": "El bien raíz se está vendiendo en otra operación, intente nuevamente"}, 409
+
+            if args['estado'] in ESTADOS_VENTA_ACTIVOS:
+                invalidar_bien_raiz(args['bien_raiz_id'])
+                indice_bienes.actualizar(args['bien_raiz_id'], {'estado_venta': args['estado'], 'venta_id': venta_ref.id})
+
+            return {"message": "Venta registrada exitosamente", "venta_id": venta_ref.id}, 201
 
         except Exception as e:
             return {"error": str(e)}, 500
            
-    @api.doc(description="Obtener las ventas registradas")
+    exportar_parser = api.parser()
+    exportar_parser.add_argument('format', type=str, location='args', choices=('json', 'ndjson', 'csv'), help='Formato de salida; ndjson y csv se envían en streaming')
+    exportar_parser.add_argument('desde', type=str, location='args', help='Fecha de venta mínima (YYYY-MM-DD)')
+    exportar_parser.add_argument('hasta', type=str, location='args', help='Fecha de venta máxima, inclusive (YYYY-MM-DD)')
+
+    @api.expect(exportar_parser)
+    @api.doc(description="Obtener las ventas registradas. Con Accept: application/x-ndjson o format=ndjson|csv "
+                         "la exportación se envía en streaming")
     def get(self):
+        args = self.exportar_parser.parse_args()
         try:
-            # Recuperar las ventas desde Firestore
-            ventas_ref = db.collection('ventas').stream()
+            query = self.consulta_ventas(args['desde'], args['hasta'])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        formato = args['format']
+        if formato is None:
+            mejor = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson', 'text/csv'])
+            formato = {'application/x-ndjson': 'ndjson', 'text/csv': 'csv'}.get(mejor, 'json')
 
+        if formato == 'ndjson':
+            return Response(stream_with_context(self.generar_ndjson(query)), mimetype='application/x-ndjson')
+        if formato == 'csv':
+            return Response(stream_with_context(self.generar_csv(query)), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=ventas.csv'})
+
+        try:
             # Crear una lista para almacenar las ventas
             ventas = []
-            for venta in ventas_ref:
+            for venta in iterar_paginado(query):
                 venta_data = venta.to_dict()
                 venta_data['venta_id'] = venta.id  # Agregar el ID de la venta al resultado
                 ventas.append(venta_data)
@@ -370,43 +1484,120 @@ class GenerarVenta(Resource):
 
         except Exception as e:
             return {"error": str(e)}, 500
-        
+
+    @staticmethod
+    def consulta_ventas(desde=None, hasta=None):
+        # Los límites de fecha se aplican en Firestore para no leer ventas fuera del rango
+        query = db.collection('ventas')
+        if desde or hasta:
+            if desde:
+                query = query.where('fecha_venta', *parsear_fecha_limite(desde))
+            if hasta:
+                query = query.where('fecha_venta', *parsear_fecha_limite(hasta, hasta=True))
+            query = query.order_by('fecha_venta')
+        return query.order_by('__name__')
+
+    @staticmethod
+    def generar_ndjson(query):
+        try:
+            for venta in iterar_paginado(query):
+                venta_data = venta.to_dict()
+                venta_data['venta_id'] = venta.id
+                yield json.dumps(venta_data, ensure_ascii=False, default=str) + '\n'
+        except Exception as e:
+            # Los encabezados ya se enviaron: se agrega un registro de error y se relanza la excepción
+            # para que el servidor corte la respuesta sin el fragmento final y no parezca completa
+            logging.exception("Error al exportar las ventas en NDJSON")
+            yield json.dumps({'error': f'Exportación incompleta: {e}'}, ensure_ascii=False) + '\n'
+            raise
+
+    @staticmethod
+    def generar_csv(query):
+        buffer = io.StringIO()
+        escritor = csv.DictWriter(buffer, fieldnames=CAMPOS_VENTA, extrasaction='ignore')
+        escritor.writeheader()
+        try:
+            for venta in iterar_paginado(query):
+                venta_data = venta.to_dict()
+                venta_data['venta_id'] = venta.id
+                escritor.writerow(venta_data)
+                if buffer.tell() >= 8192:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        except Exception:
+            # Se relanza para que el servidor corte la respuesta: un CSV truncado no debe parecer completo
+            logging.exception("Error al exportar las ventas en CSV")
+            raise
+
 @api.route('/bienes_raices/<string:id>')
 class BienRaizDetail(Resource):
     @api.doc(description="Obtener los detalles de un bien raíz por ID")
     def get(self, id):
         try:
-            # Buscar el documento en la colección bienes_raices por el ID
-            doc_ref = db.collection('bienes_raices').document(id)
-            doc = doc_ref.get()
-
-            # Verificar si el documento existe
-            if doc.exists:
-                bien_raiz = doc.to_dict()
-                bien_raiz['id'] = doc.id  # Añadir el ID al resultado
-                return {"message": "Bien raíz encontrado", "data": bien_raiz}, 200
+            clave = f"bien_raiz:v{cache.version(f'bien_raiz:{id}')}:{id}"
+            cargado = cache.obtener(clave, lambda: self.cargar_bien_raiz(id))
+
+            if cargado is not None:
+                no_modificada = respuesta_no_modificada(cargado['etag'])
+                if no_modificada is not None:
+                    return no_modificada
+                return {"message": "Bien raíz encontrado", "data": cargado['data']}, 200, encabezados_etag(cargado['etag'])
             else:
                 return {"error": f"No se encontró ningún bien raíz con ID: {id}"}, 404
         except Exception as e:
             return {"error": f"Error al obtener el bien raíz: {str(e)}"}, 500
 
+    @staticmethod
+    def cargar_bien_raiz(id):
+        # Buscar el documento en la colección bienes_raices por el ID
+        doc = db.collection('bienes_raices').document(id).get()
+
+        # Verificar si el documento existe
+        if not doc.exists:
+            return None
+        bien_raiz = doc.to_dict()
+        bien_raiz['id'] = doc.id  # Añadir el ID al resultado
+        return {'data': bien_raiz, 'etag': etag_documentos([doc], 'bien_raiz')}
+
 @api.route('/compras')
 class Compras(Resource):
-    @api.doc(description="Obtener todas las compras realizadas por un comprador")
+    compras_parser = api.parser()
+    compras_parser.add_argument('expand', type=str, location='args',
+                                help='Relaciones a incrustar separadas por coma: bien_raiz, vendedor, comprador')
+
+    @api.expect(compras_parser)
+    @api.doc(description="Obtener todas las compras realizadas por un comprador. Con expand= se incrustan los datos "
+                         "del bien raíz, el vendedor o el comprador de cada compra")
     def get(self):
         # Obtener el ID del comprador desde la sesión
         comprador_id = session.get('user_id')
         if not comprador_id:
             return {"error": "No se encontró un usuario autenticado"}, 401
 
+        args = self.compras_parser.parse_args()
+        try:
+            expansiones = parsear_expansiones(args['expand'])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
         # Buscar todas las ventas donde el comprador_id coincida
         compras = []
-        docs = db.collection('ventas').where('comprador_id', '==', comprador_id).stream()
+        docs = list(db.collection('ventas').where('comprador_id', '==', comprador_id).stream())
+        # Los documentos relacionados se leen en lote, no uno por fila
+        relacionados, leidos = leer_relacionados(docs, expansiones)
+
+        # Si ninguna venta (ni documento incrustado) cambió desde la última consulta del cliente se responde 304
+        etag = etag_documentos(docs + leidos, 'compras', comprador_id, ','.join(expansiones))
+        no_modificada = respuesta_no_modificada(etag, privada=True)
+        if no_modificada is not None:
+            return no_modificada
 
         for doc in docs:
             compra = doc.to_dict()
             compra['id'] = doc.id  # Obtener el ID de la venta
-            compras.append({
+            compras.append(incrustar_relacionados({
                 'id': compra['id'],
                 'bien_raiz_id': compra['bien_raiz_id'],
                 'vendedor_id': compra['vendedor_id'],
@@ -415,28 +1606,48 @@ class Compras(Resource):
                 'estado': compra['estado'],
                 'forma_pago': compra['forma_pago'],
                 'notas': compra.get('notas')
-            })
+            }, compra, expansiones, relacionados))
 
-        return compras, 200
+        return compras, 200, encabezados_etag(etag, privada=True)
 
 
 @api.route('/ventas')
 class Ventas(Resource):
-    @api.doc(description="Obtener todas las ventas realizadas por un vendedor")
+    ventas_parser = api.parser()
+    ventas_parser.add_argument('expand', type=str, location='args',
+                              help='Relaciones a incrustar separadas por coma: bien_raiz, vendedor, comprador')
+
+    @api.expect(ventas_parser)
+    @api.doc(description="Obtener todas las ventas realizadas por un vendedor. Con expand= se incrustan los datos "
+                         "del bien raíz, el vendedor o el comprador de cada venta")
     def get(self):
         # Obtener el ID del vendedor desde la sesión
         vendedor_id = session.get('user_id')
         if not vendedor_id:
             return {"error": "No se encontró un usuario autenticado"}, 401
 
+        args = self.ventas_parser.parse_args()
+        try:
+            expansiones = parsear_expansiones(args['expand'])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
         # Buscar todas las ventas donde el vendedor_id coincida
         ventas = []
-        docs = db.collection('ventas').where('vendedor_id', '==', vendedor_id).stream()
+        docs = list(db.collection('ventas').where('vendedor_id', '==', vendedor_id).stream())
+        # Los documentos relacionados se leen en lote, no uno por fila
+        relacionados, leidos = leer_relacionados(docs, expansiones)
+
+        # Si ninguna venta (ni documento incrustado) cambió desde la última consulta del cliente se responde 304
+        etag = etag_documentos(docs + leidos, 'ventas', vendedor_id, ','.join(expansiones))
+        no_modificada = respuesta_no_modificada(etag, privada=True)
+        if no_modificada is not None:
+            return no_modificada
 
         for doc in docs:
             venta = doc.to_dict()
             venta['id'] = doc.id  # Obtener el ID de la venta
-            ventas.append({
+            ventas.append(incrustar_relacionados({
                 'id': venta['id'],
                 'bien_raiz_id': venta['bien_raiz_id'],
                 'comprador_id': venta['comprador_id'],
@@ -445,9 +1656,65 @@ class Ventas(Resource):
                 'estado': venta['estado'],
                 'forma_pago': venta['forma_pago'],
                 'notas': venta.get('notas')
-            })
+            }, venta, expansiones, relacionados))
+
+        return ventas, 200, encabezados_etag(etag, privada=True)
+
+@api.route('/metrics')
+class MetricasPrometheus(Resource):
+    @api.doc(description="Métricas de latencia por ruta y de las llamadas a Firestore y Storage en formato Prometheus")
+    def get(self):
+        return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/cache/estadisticas')
+class CacheEstadisticas(Resource):
+    @api.doc(description="Obtener los contadores de aciertos, fallos y desalojos de la caché")
+    def get(self):
+        return cache.estadisticas(), 200
 
-        return ventas, 200
+@api.route('/imagenes/estadisticas')
+class ImagenesEstadisticas(Resource):
+    @api.doc(description="Obtener la profundidad de la cola y los tiempos del procesamiento de imágenes")
+    def get(self):
+        return procesador_imagenes.estadisticas(), 200
+
+@api.route('/sesion/refrescar')
+class RefrescarSesion(Resource):
+    @api.doc(description="Volver a leer el rol del usuario y actualizar la sesión (por ejemplo, tras un cambio de rol)")
+    def post(self):
+        user_id = session.get('user_id')
+        if not user_id:
+            return {"error": "No se encontró un usuario autenticado"}, 401
+        rol = rol_de_sesion(user_id, refrescar=True)
+        if rol is None:
+            return {"error": "Usuario no encontrado en la base de datos"}, 404
+        return {"message": "Sesión actualizada", "tipo_usuario": rol['tipo_usuario'],
+                "nombre_completo": rol['nombre_completo']}, 200
+
+@api.route('/ventas/resumen')
+class VentasResumen(Resource):
+    resumen_parser = api.parser()
+    resumen_parser.add_argument('rol', type=str, location='args', choices=('vendedor', 'comprador'), help='Resumen como vendedor o como comprador (por defecto el rol de la sesión)')
+
+    @api.expect(resumen_parser)
+    @api.doc(description="Obtener los totales de ventas por estado, forma de pago y mes del usuario autenticado")
+    @requiere_rol()
+    def get(self):
+        args = self.resumen_parser.parse_args()
+        user_id = session.get('user_id')
+        rol = args['rol'] or session['rol']['tipo_usuario']
+        try:
+            # Se leen solo los shards del usuario, sin importar cuántas ventas tenga
+            snapshots = db.get_all(referencias_resumen(rol, user_id))
+            return dict(sumar_resumenes(snapshots), rol=rol, usuario_id=user_id), 200
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+@api.route('/storage/limpieza')
+class LimpiezaStorage(Resource):
+    @api.doc(description="Obtener los contadores del borrado de imágenes sin uso")
+    def get(self):
+        return limpiador_storage.estadisticas(), 200
 
 @api.route('/cerrar_sesion')
 class CerrarSesion(Resource):
@@ -455,8 +1722,12 @@ class CerrarSesion(Resource):
     def post(self):
         # Eliminar el ID del usuario de la sesión
         session.pop('user_id', None)
+        session.pop('rol', None)
 
         return {"message": "Sesión cerrada correctamente"}, 200
         
+# App para el servidor de desarrollo, el benchmark y servidor.py, que la importa antes del fork
+app = crear_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,663 @@
+"""Backend de datos en memoria que imita a Firestore, Storage y Auth.
+
+Implementa solo las operaciones que usan los handlers de app.py y permite
+inyectar una latencia configurable por llamada para simular la red. Se usa
+con BACKEND_DATOS=memoria para medir el rendimiento sin credenciales.
+"""
+import copy
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+def _ahora():
+    return datetime.now(timezone.utc)
+
+
+def _nuevo_id():
+    return uuid.uuid4().hex[:20]
+
+
+class Latencia:
+    """Simula el tiempo de ida y vuelta de cada llamada al servicio."""
+
+    def __init__(self, segundos=0.0, variacion=0.0):
+        self.segundos = segundos
+        self.variacion = variacion
+
+    def esperar(self):
+        demora = self.segundos
+        if self.variacion:
+            demora += random.uniform(0, self.variacion)
+        if demora > 0:
+            time.sleep(demora)
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+class Increment:
+    """Equivalente a firestore.Increment: suma el valor al campo al escribir."""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Abortada(Exception):
+    """La transacción leyó documentos que cambiaron antes de confirmarse."""
+
+
+def _resolver(valor, actual):
+    if isinstance(valor, Increment):
+        base = actual if isinstance(actual, (int, float)) and not isinstance(actual, bool) else 0
+        return base + valor.value
+    if isinstance(valor, dict):
+        return {clave: _resolver(v, None) for clave, v in valor.items()}
+    return copy.deepcopy(valor)
+
+
+def _fusionar(destino, datos):
+    # set(merge=True) combina los mapas anidados en lugar de reemplazarlos
+    for clave, valor in datos.items():
+        if isinstance(valor, dict) and isinstance(destino.get(clave), dict):
+            _fusionar(destino[clave], valor)
+        else:
+            destino[clave] = _resolver(valor, destino.get(clave))
+
+class SnapshotMemoria:
+    def __init__(self, referencia, datos, create_time=None, update_time=None):
+        self.reference = referencia
+        self._data = datos
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = _ahora()
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, campo):
+        valor = self._data
+        for parte in campo.split('.'):
+            valor = valor[parte]
+        return copy.deepcopy(valor)
+
+
+class ReferenciaMemoria:
+    def __init__(self, cliente, coleccion, doc_id):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f'{self._coleccion}/{self.id}'
+
+    @property
+    def parent(self):
+        return self._cliente.collection(self._coleccion)
+
+    def __eq__(self, otro):
+        return isinstance(otro, ReferenciaMemoria) and otro.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def get(self, field_paths=None, transaction=None):
+        self._cliente.latencia.esperar()
+        snapshot = self._cliente._leer(self._coleccion, self.id, field_paths)
+        if transaction is not None:
+            transaction._registrar_lectura(snapshot)
+        return snapshot
+
+    def set(self, datos, merge=False):
+        self._cliente.latencia.esperar()
+        return self._cliente._escribir(self._coleccion, self.id, datos, merge=merge)
+
+    def create(self, datos):
+        self._cliente.latencia.esperar()
+        return self._cliente._crear(self._coleccion, self.id, datos)
+
+    def update(self, datos):
+        self._cliente.latencia.esperar()
+        return self._cliente._actualizar(self._coleccion, self.id, datos)
+
+    def delete(self):
+        self._cliente.latencia.esperar()
+        return self._cliente._borrar(self._coleccion, self.id)
+
+
+_OPERADORES = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'not-in': lambda a, b: a not in b,
+    'array-contains': lambda a, b: isinstance(a, list) and b in a,
+    'array-contains-any': lambda a, b: isinstance(a, list) and any(x in a for x in b),
+}
+
+_FALTA = object()
+
+
+def _valor_campo(doc_id, datos, campo):
+    if campo == '__name__':
+        return doc_id
+    valor = datos
+    for parte in campo.split('.'):
+        if not isinstance(valor, dict) or parte not in valor:
+            return _FALTA
+        valor = valor[parte]
+    return valor
+
+
+class QueryMemoria:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), limite=None,
+                 campos=None, inicio=None, fin=None):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._orden = tuple(orden)
+        self._limite = limite
+        self._campos = campos
+        self._inicio = inicio  # (valores, incluido)
+        self._fin = fin
+
+    def _copiar(self, **cambios):
+        estado = dict(filtros=self._filtros, orden=self._orden, limite=self._limite,
+                      campos=self._campos, inicio=self._inicio, fin=self._fin)
+        estado.update(cambios)
+        return QueryMemoria(self._cliente, self._coleccion, **estado)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERADORES:
+            raise ValueError(f'Operador no soportado: {op_string}')
+        return self._copiar(filtros=self._filtros + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copiar(orden=self._orden + ((field_path, direction),))
+
+    def limit(self, cantidad):
+        return self._copiar(limite=cantidad)
+
+    def select(self, field_paths):
+        return self._copiar(campos=list(field_paths))
+
+    def _cursor(self, valores):
+        if isinstance(valores, SnapshotMemoria):
+            datos = dict(valores._data or {})
+            datos['__name__'] = valores.id
+            valores = datos
+        if isinstance(valores, dict):
+            return [valores[campo] for campo, _ in self._orden_efectivo() if campo in valores]
+        return list(valores)
+
+    def start_after(self, valores):
+        return self._copiar(inicio=(self._cursor(valores), False))
+
+    def start_at(self, valores):
+        return self._copiar(inicio=(self._cursor(valores), True))
+
+    def end_before(self, valores):
+        return self._copiar(fin=(self._cursor(valores), False))
+
+    def end_at(self, valores):
+        return self._copiar(fin=(self._cursor(valores), True))
+
+    def _orden_efectivo(self):
+        orden = list(self._orden)
+        if not any(campo == '__name__' for campo, _ in orden):
+            direccion = orden[-1][1] if orden else self.ASCENDING
+            orden.append(('__name__', direccion))
+        return orden
+
+    def _clave(self, doc_id, datos):
+        clave = []
+        for campo, direccion in self._orden_efectivo():
+            valor = _valor_campo(doc_id, datos, campo)
+            if isinstance(valor, ReferenciaMemoria):
+                valor = valor.id
+            clave.append(_Ordenable(valor, direccion == self.DESCENDING))
+        return clave
+
+    def _ejecutar(self):
+        documentos = self._cliente._documentos(self._coleccion)
+        resultado = []
+        for doc_id, (datos, creado, actualizado) in documentos:
+            if not all(self._cumple(doc_id, datos, filtro) for filtro in self._filtros):
+                continue
+            # Firestore excluye los documentos que no tienen el campo ordenado
+            if any(_valor_campo(doc_id, datos, campo) is _FALTA for campo, _ in self._orden):
+                continue
+            resultado.append((doc_id, datos, creado, actualizado))
+        resultado.sort(key=lambda fila: self._clave(fila[0], fila[1]))
+
+        if self._inicio is not None:
+            valores, incluido = self._inicio
+            resultado = [fila for fila in resultado
+                         if self._comparar_cursor(fila, valores, incluido, desde=True)]
+        if self._fin is not None:
+            valores, incluido = self._fin
+            resultado = [fila for fila in resultado
+                         if self._comparar_cursor(fila, valores, incluido, desde=False)]
+        if self._limite is not None:
+            resultado = resultado[:self._limite]
+
+        snapshots = []
+        for doc_id, datos, creado, actualizado in resultado:
+            if self._campos is not None:
+                datos = {campo: datos[campo] for campo in self._campos if campo in datos}
+            referencia = ReferenciaMemoria(self._cliente, self._coleccion, doc_id)
+            snapshots.append(SnapshotMemoria(referencia, copy.deepcopy(datos), creado, actualizado))
+        return snapshots
+
+    def _cumple(self, doc_id, datos, filtro):
+        campo, operador, esperado = filtro
+        valor = _valor_campo(doc_id, datos, campo)
+        if valor is _FALTA:
+            return False
+        try:
+            return _OPERADORES[operador](valor, esperado)
+        except TypeError:
+            return False
+
+    def _comparar_cursor(self, fila, valores, incluido, desde):
+        clave = self._clave(fila[0], fila[1])[:len(valores)]
+        orden = self._orden_efectivo()[:len(valores)]
+        cursor = []
+        for valor, (_, direccion) in zip(valores, orden):
+            if isinstance(valor, ReferenciaMemoria):
+                valor = valor.id
+            cursor.append(_Ordenable(valor, direccion == self.DESCENDING))
+        if clave == cursor:
+            return incluido
+        return clave > cursor if desde else clave < cursor
+
+    def stream(self, transaction=None):
+        self._cliente.latencia.esperar()
+        with self._cliente._lock:
+            snapshots = self._ejecutar()
+        return iter(snapshots)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+
+class _Ordenable:
+    """Envuelve un valor para ordenar tipos mixtos y direcciones descendentes."""
+
+    _RANGO = {type(None): 0, bool: 1, int: 2, float: 2, datetime: 3, str: 4, bytes: 5, list: 6, dict: 7}
+
+    def __init__(self, valor, descendente):
+        if valor is _FALTA:
+            valor = None
+        self.valor = valor
+        self.rango = self._RANGO.get(type(valor), 8)
+        self.descendente = descendente
+
+    def _tupla(self):
+        return (self.rango, self.valor if self.rango in (2, 3, 4, 5) else 0)
+
+    def __eq__(self, otro):
+        return self._tupla() == otro._tupla()
+
+    def __lt__(self, otro):
+        if self.descendente:
+            return self._tupla() > otro._tupla()
+        return self._tupla() < otro._tupla()
+
+    def __gt__(self, otro):
+        return otro < self
+
+
+class ColeccionMemoria(QueryMemoria):
+    def __init__(self, cliente, nombre):
+        super().__init__(cliente, nombre)
+        self.id = nombre
+
+    def document(self, document_id=None):
+        return ReferenciaMemoria(self._cliente, self._coleccion, document_id or _nuevo_id())
+
+    def add(self, datos, document_id=None):
+        referencia = self.document(document_id)
+        resultado = referencia.create(datos)
+        return resultado.update_time, referencia
+
+    def list_documents(self):
+        return [ReferenciaMemoria(self._cliente, self._coleccion, doc_id)
+                for doc_id, _ in self._cliente._documentos(self._coleccion)]
+
+
+class ResultadoEscritura:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class ClienteFirestoreMemoria:
+    def __init__(self, latencia=None):
+        self.latencia = latencia or Latencia()
+        self._datos = {}  # coleccion -> {doc_id: (datos, create_time, update_time)}
+        self._lock = threading.RLock()
+
+    def collection(self, nombre):
+        return ColeccionMemoria(self, nombre)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self.latencia.esperar()
+        snapshots = [self._leer(ref._coleccion, ref.id, field_paths) for ref in references]
+        if transaction is not None:
+            for snapshot in snapshots:
+                transaction._registrar_lectura(snapshot)
+        return iter(snapshots)
+
+    def batch(self):
+        return LoteMemoria(self)
+
+    def transaction(self, max_attempts=5, read_only=False):
+        return TransaccionMemoria(self, max_attempts)
+
+    def _documentos(self, coleccion):
+        with self._lock:
+            return list(self._datos.get(coleccion, {}).items())
+
+    def _leer(self, coleccion, doc_id, field_paths=None):
+        referencia = ReferenciaMemoria(self, coleccion, doc_id)
+        with self._lock:
+            entrada = self._datos.get(coleccion, {}).get(doc_id)
+            if entrada is None:
+                return SnapshotMemoria(referencia, None)
+            datos, creado, actualizado = entrada
+            if field_paths is not None:
+                datos = {campo: datos[campo] for campo in field_paths if campo in datos}
+            return SnapshotMemoria(referencia, copy.deepcopy(datos), creado, actualizado)
+
+    def _escribir(self, coleccion, doc_id, datos, merge=False):
+        ahora = _ahora()
+        with self._lock:
+            documentos = self._datos.setdefault(coleccion, {})
+            anterior = documentos.get(doc_id)
+            creado = anterior[1] if anterior else ahora
+            if anterior and merge:
+                nuevos = copy.deepcopy(anterior[0])
+                _fusionar(nuevos, datos)
+            else:
+                nuevos = _resolver(dict(datos), None)
+            documentos[doc_id] = (nuevos, creado, ahora)
+        return ResultadoEscritura(ahora)
+
+    def _crear(self, coleccion, doc_id, datos):
+        with self._lock:
+            if doc_id in self._datos.get(coleccion, {}):
+                raise ValueError(f'El documento {coleccion}/{doc_id} ya existe')
+            return self._escribir(coleccion, doc_id, datos)
+
+    def _actualizar(self, coleccion, doc_id, datos):
+        ahora = _ahora()
+        with self._lock:
+            documentos = self._datos.get(coleccion, {})
+            if doc_id not in documentos:
+                raise KeyError(f'No existe el documento {coleccion}/{doc_id}')
+            actuales, creado, _ = documentos[doc_id]
+            actuales = copy.deepcopy(actuales)
+            for campo, valor in datos.items():
+                destino = actuales
+                partes = campo.split('.')
+                for parte in partes[:-1]:
+                    destino = destino.setdefault(parte, {})
+                destino[partes[-1]] = _resolver(valor, destino.get(partes[-1]))
+            documentos[doc_id] = (actuales, creado, ahora)
+        return ResultadoEscritura(ahora)
+
+    def _version(self, coleccion, doc_id):
+        entrada = self._datos.get(coleccion, {}).get(doc_id)
+        return entrada[2] if entrada else None
+
+    def _borrar(self, coleccion, doc_id):
+        with self._lock:
+            self._datos.get(coleccion, {}).pop(doc_id, None)
+        return ResultadoEscritura(_ahora())
+
+
+class LoteMemoria:
+    """Equivalente a WriteBatch: acumula escrituras y las aplica juntas en commit()."""
+
+    LIMITE_OPERACIONES = 500
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._escrituras = []
+
+    def __len__(self):
+        return len(self._escrituras)
+
+    def _agregar(self, operacion, referencia, args=(), kwargs=None):
+        if len(self._escrituras) >= self.LIMITE_OPERACIONES:
+            raise ValueError(f'Un lote admite como máximo {self.LIMITE_OPERACIONES} operaciones')
+        self._escrituras.append((operacion, referencia, args, kwargs or {}))
+
+    def set(self, referencia, datos, merge=False):
+        self._agregar(self._cliente._escribir, referencia, (datos,), {'merge': merge})
+
+    def create(self, referencia, datos):
+        self._agregar(self._cliente._crear, referencia, (datos,))
+
+    def update(self, referencia, datos):
+        self._agregar(self._cliente._actualizar, referencia, (datos,))
+
+    def delete(self, referencia):
+        self._agregar(self._cliente._borrar, referencia)
+
+    def _aplicar(self):
+        for operacion, referencia, args, kwargs in self._escrituras:
+            operacion(referencia._coleccion, referencia.id, *args, **kwargs)
+
+    def commit(self):
+        self._cliente.latencia.esperar()
+        with self._cliente._lock:
+            self._aplicar()
+        return [ResultadoEscritura(_ahora()) for _ in self._escrituras]
+
+
+class TransaccionMemoria(LoteMemoria):
+    """Transacción optimista: falla al confirmar si un documento leído cambió."""
+
+    def __init__(self, cliente, max_attempts=5):
+        super().__init__(cliente)
+        self._max_attempts = max_attempts
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lecturas = {}  # (coleccion, id) -> update_time visto
+        self._escrituras = []
+
+    def _registrar_lectura(self, snapshot):
+        referencia = snapshot.reference
+        self._lecturas.setdefault((referencia._coleccion, referencia.id), snapshot.update_time)
+
+    def _confirmar(self):
+        self._cliente.latencia.esperar()
+        with self._cliente._lock:
+            for (coleccion, doc_id), visto in self._lecturas.items():
+                if self._cliente._version(coleccion, doc_id) != visto:
+                    raise Abortada(f'El documento {coleccion}/{doc_id} cambió durante la transacción')
+            self._aplicar()
+
+
+class _Transaccional:
+    def __init__(self, funcion):
+        self.funcion = funcion
+
+    def __call__(self, transaccion, *args, **kwargs):
+        for _ in range(transaccion._max_attempts):
+            transaccion._reiniciar()
+            resultado = self.funcion(transaccion, *args, **kwargs)
+            try:
+                transaccion._confirmar()
+                return resultado
+            except Abortada:
+                continue
+        raise ValueError(f'No se pudo confirmar la transacción en {transaccion._max_attempts} intentos')
+
+
+def transactional(funcion):
+    """Equivalente a firestore.transactional para el backend en memoria."""
+    return _Transaccional(funcion)
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+class BlobMemoria:
+    def __init__(self, bucket, nombre):
+        self.bucket = bucket
+        self.name = nombre
+        self.content_type = None
+        self.size = None
+        self.metadata = None
+        self.updated = None
+
+    @property
+    def public_url(self):
+        return f'https://storage.googleapis.com/{self.bucket.name}/{self.name}'
+
+    def upload_from_file(self, archivo, content_type=None, **kwargs):
+        self.upload_from_string(archivo.read(), content_type=content_type)
+
+    def upload_from_string(self, datos, content_type=None, **kwargs):
+        self.bucket.latencia.esperar()
+        if isinstance(datos, str):
+            datos = datos.encode('utf-8')
+        self.content_type = content_type
+        self.size = len(datos)
+        self.updated = _ahora()
+        with self.bucket._lock:
+            self.bucket._blobs[self.name] = {'datos': bytes(datos), 'content_type': content_type,
+                                             'publico': False, 'metadata': self.metadata,
+                                             'actualizado': self.updated}
+
+    def download_as_bytes(self, **kwargs):
+        self.bucket.latencia.esperar()
+        with self.bucket._lock:
+            entrada = self.bucket._blobs.get(self.name)
+        if entrada is None:
+            raise KeyError(f'No existe el blob {self.name}')
+        return entrada['datos']
+
+    def exists(self, **kwargs):
+        self.bucket.latencia.esperar()
+        with self.bucket._lock:
+            return self.name in self.bucket._blobs
+
+    def make_public(self, **kwargs):
+        self.bucket.latencia.esperar()
+        with self.bucket._lock:
+            if self.name not in self.bucket._blobs:
+                raise KeyError(f'No existe el blob {self.name}')
+            self.bucket._blobs[self.name]['publico'] = True
+
+    def delete(self, **kwargs):
+        self.bucket.latencia.esperar()
+        with self.bucket._lock:
+            if self.bucket._blobs.pop(self.name, None) is None:
+                raise KeyError(f'No existe el blob {self.name}')
+
+    def generate_signed_url(self, expiration=3600, **kwargs):
+        return f'{self.public_url}?expira={expiration}'
+
+
+class BucketMemoria:
+    def __init__(self, nombre, latencia=None):
+        self.name = nombre
+        self.latencia = latencia or Latencia()
+        self._blobs = {}
+        self._lock = threading.RLock()
+
+    def blob(self, nombre):
+        return BlobMemoria(self, nombre)
+
+    def get_blob(self, nombre):
+        self.latencia.esperar()
+        with self._lock:
+            entrada = self._blobs.get(nombre)
+        if entrada is None:
+            return None
+        blob = BlobMemoria(self, nombre)
+        blob.content_type = entrada['content_type']
+        blob.size = len(entrada['datos'])
+        blob.metadata = entrada['metadata']
+        blob.updated = entrada['actualizado']
+        return blob
+
+    def list_blobs(self, prefix=None):
+        self.latencia.esperar()
+        with self._lock:
+            nombres = sorted(self._blobs)
+        return [self.get_blob(nombre) for nombre in nombres
+                if prefix is None or nombre.startswith(prefix)]
+
+
+# ---------------------------------------------------------------------------
+# Auth
+# ---------------------------------------------------------------------------
+
+class UsuarioNoEncontrado(Exception):
+    pass
+
+
+class UsuarioMemoria:
+    def __init__(self, uid, email):
+        self.uid = uid
+        self.email = email
+
+
+class AuthMemoria:
+    UserNotFoundError = UsuarioNoEncontrado
+
+    def __init__(self, latencia=None):
+        self.latencia = latencia or Latencia()
+        self._por_email = {}
+        self._lock = threading.Lock()
+
+    def create_user(self, email=None, password=None, uid=None, **kwargs):
+        self.latencia.esperar()
+        with self._lock:
+            if email in self._por_email:
+                raise ValueError(f'Ya existe un usuario con el email {email}')
+            usuario = UsuarioMemoria(uid or _nuevo_id(), email)
+            self._por_email[email] = usuario
+        return usuario
+
+    def get_user_by_email(self, email):
+        self.latencia.esperar()
+        with self._lock:
+            usuario = self._por_email.get(email)
+        if usuario is None:
+            raise UsuarioNoEncontrado(f'No existe un usuario con el email {email}')
+        return usuario
+
+
+def crear_backend_memoria(nombre_bucket, latencia=0.0, variacion=0.0):
+    """Devuelve (db, bucket, auth) en memoria compartiendo la misma latencia simulada."""
+    simulada = Latencia(latencia, variacion)
+    return (ClienteFirestoreMemoria(simulada),
+            BucketMemoria(nombre_bucket, simulada),
+            AuthMemoria(simulada))
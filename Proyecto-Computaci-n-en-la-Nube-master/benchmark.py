@@ -0,0 +1,205 @@
+"""Benchmark de los endpoints principales sobre el backend en memoria.
+
+Carga datos de prueba en el backend en memoria y lanza peticiones
+concurrentes con el cliente de pruebas de Flask, midiendo el throughput y
+la latencia p50/p95/p99 de cada endpoint.
+
+Uso:
+    python Proyecto-Computaci-n-en-la-Nube-master/benchmark.py --hilos 8 --peticiones 500 --latencia-ms 5
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# El benchmark siempre corre sobre el backend en memoria
+os.environ['BACKEND_DATOS'] = 'memoria'
+
+import app as aplicacion  # noqa: E402
+
+BASE_URL = 'https://localhost'  # Las cookies de sesión son Secure
+PASSWORD = 'benchmark123'
+
+
+def poblar_datos(cantidad_bienes, cantidad_ventas, cantidad_usuarios):
+    """Crea usuarios, bienes raíces y ventas de prueba; devuelve (vendedores, compradores, ids de bienes)."""
+    db, auth = aplicacion.db, aplicacion.auth
+    vendedores, compradores = [], []
+    for i in range(cantidad_usuarios):
+        for tipo, destino in (('vendedor', vendedores), ('comprador', compradores)):
+            email = f'{tipo}{i}@benchmark.local'
+            usuario = auth.create_user(email=email, password=PASSWORD)
+            db.collection('user').document(usuario.uid).set({
+                'email': email,
+                'nombre_completo': f'{tipo.capitalize()} {i}',
+                'tipo_usuario': tipo,
+                'password': PASSWORD
+            })
+            destino.append((email, usuario.uid))
+
+    bienes = []
+    for i in range(cantidad_bienes):
+        _, vendedor_id = vendedores[i % len(vendedores)]
+        _, ref = db.collection('bienes_raices').add({
+            'nombre': f'Propiedad {i}',
+            'precio': 50000 + (i * 137) % 450000,
+            'ubicacion': f'Sector {i % 25}',
+            'descripcion': f'Propiedad de prueba número {i}',
+            'habitaciones': 1 + i % 5,
+            'banos': 1 + i % 3,
+            'imagen_url': f'https://example.com/{i}.jpg',
+            'vendedor_id': vendedor_id
+        })
+        bienes.append((ref.id, vendedor_id))
+
+    for i in range(cantidad_ventas):
+        bien_id, vendedor_id = bienes[i % len(bienes)]
+        _, comprador_id = compradores[i % len(compradores)]
+        db.collection('ventas').add({
+            'bien_raiz_id': bien_id,
+            'comprador_id': comprador_id,
+            'vendedor_id': vendedor_id,
+            'fecha_venta': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:00',
+            'precio_final': 50000 + (i * 91) % 450000,
+            'estado': ('pendiente', 'completada', 'cancelada')[i % 3],
+            'forma_pago': ('efectivo', 'transferencia bancaria', 'financiamiento')[i % 3]
+        })
+    return vendedores, compradores, [bien_id for bien_id, _ in bienes]
+
+
+def cliente_con_sesion(email):
+    cliente = aplicacion.app.test_client()
+    respuesta = cliente.post('/login', json={'email': email, 'password': PASSWORD}, base_url=BASE_URL)
+    if respuesta.status_code != 201:
+        raise RuntimeError(f'No se pudo iniciar sesión con {email}: {respuesta.get_json()}')
+    return cliente
+
+
+def escenarios(vendedores, compradores, bienes):
+    """Cada escenario recibe (cliente, i) y devuelve la respuesta de una petición."""
+    return {
+        'POST /login': (None, lambda cliente, i: cliente.post(
+            '/login', json={'email': compradores[i % len(compradores)][0], 'password': PASSWORD},
+            base_url=BASE_URL)),
+        'GET /bienes_raices?todos=true': (None, lambda cliente, i: cliente.get(
+            '/bienes_raices?todos=true', base_url=BASE_URL)),
+        'GET /bienes_raices': (None, lambda cliente, i: cliente.get(
+            '/bienes_raices', base_url=BASE_URL)),
+        'POST /generar_venta': (compradores, lambda cliente, i: cliente.post(
+            '/generar_venta', json={
+                'bien_raiz_id': bienes[i % len(bienes)],
+                'precio_final': 100000,
+                'forma_pago': 'efectivo',
+                'estado': 'pendiente'
+            }, base_url=BASE_URL)),
+        'GET /generar_venta': (None, lambda cliente, i: cliente.get(
+            '/generar_venta', base_url=BASE_URL)),
+        'GET /compras': (compradores, lambda cliente, i: cliente.get(
+            '/compras', base_url=BASE_URL)),
+        'GET /ventas': (vendedores, lambda cliente, i: cliente.get(
+            '/ventas', base_url=BASE_URL)),
+        'GET /compras?expand=...': (compradores, lambda cliente, i: cliente.get(
+            '/compras?expand=bien_raiz,vendedor,comprador', base_url=BASE_URL)),
+    }
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def medir(nombre, usuarios, peticion, hilos, peticiones):
+    """Ejecuta las peticiones repartidas entre los hilos y devuelve las métricas."""
+    locales = threading.local()
+    latencias = []
+    errores = 0
+    lock = threading.Lock()
+
+    def cliente_del_hilo():
+        if not hasattr(locales, 'cliente'):
+            if usuarios:
+                indice = threading.get_ident() % len(usuarios)
+                locales.cliente = cliente_con_sesion(usuarios[indice][0])
+            else:
+                locales.cliente = aplicacion.app.test_client()
+        return locales.cliente
+
+    def ejecutar(i):
+        nonlocal errores
+        cliente = cliente_del_hilo()
+        inicio = time.perf_counter()
+        respuesta = peticion(cliente, i)
+        duracion = time.perf_counter() - inicio
+        with lock:
+            latencias.append(duracion)
+            if respuesta.status_code >= 400:
+                errores += 1
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        list(executor.map(ejecutar, range(peticiones)))
+    total = time.perf_counter() - inicio
+
+    return {
+        'endpoint': nombre,
+        'peticiones': peticiones,
+        'errores': errores,
+        'throughput': peticiones / total if total else 0.0,
+        'p50_ms': percentil(latencias, 50) * 1000,
+        'p95_ms': percentil(latencias, 95) * 1000,
+        'p99_ms': percentil(latencias, 99) * 1000,
+        'media_ms': statistics.fmean(latencias) * 1000 if latencias else 0.0,
+    }
+
+
+def imprimir_tabla(resultados):
+    encabezado = f"{'Endpoint':<30}{'Peticiones':>11}{'Errores':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(encabezado)
+    print('-' * len(encabezado))
+    for r in resultados:
+        print(f"{r['endpoint']:<30}{r['peticiones']:>11}{r['errores']:>9}{r['throughput']:>10.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los endpoints de la API de bienes raíces')
+    parser.add_argument('--hilos', type=int, default=8, help='Cantidad de hilos concurrentes')
+    parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por endpoint')
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help='Latencia simulada por llamada al backend')
+    parser.add_argument('--variacion-ms', type=float, default=0.0, help='Variación aleatoria de la latencia')
+    parser.add_argument('--bienes', type=int, default=1000, help='Cantidad de bienes raíces de prueba')
+    parser.add_argument('--ventas', type=int, default=2000, help='Cantidad de ventas de prueba')
+    parser.add_argument('--usuarios', type=int, default=20, help='Cantidad de vendedores y de compradores')
+    parser.add_argument('--endpoint', action='append', help='Medir solo este endpoint (se puede repetir)')
+    parser.add_argument('--json', action='store_true', help='Imprimir los resultados en JSON')
+    args = parser.parse_args()
+
+    # app.py configura logging en DEBUG, lo que distorsiona las mediciones
+    logging.getLogger().setLevel(logging.WARNING)
+
+    vendedores, compradores, bienes = poblar_datos(args.bienes, args.ventas, args.usuarios)
+    # La latencia se activa después de poblar para no afectar la preparación
+    aplicacion.db.latencia.segundos = args.latencia_ms / 1000
+    aplicacion.db.latencia.variacion = args.variacion_ms / 1000
+
+    resultados = []
+    for nombre, (usuarios, peticion) in escenarios(vendedores, compradores, bienes).items():
+        if args.endpoint and nombre not in args.endpoint:
+            continue
+        resultados.append(medir(nombre, usuarios, peticion, args.hilos, args.peticiones))
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        imprimir_tabla(resultados)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark de la serialización del catálogo de bienes raíces.
+
+Compara la ruta original (dict por documento con serializar_bien_raiz, luego
+marshal() de flask-restx y json.dumps) con la ruta rápida (Serializador en una
+sola pasada y codificar_json) para varias cantidades de filas, y verifica que
+ambas produzcan el mismo JSON.
+
+Uso:
+    python Proyecto-Computaci-n-en-la-Nube-master/benchmark_serializacion.py --filas 1000 10000 100000
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+# El benchmark no necesita Firebase
+os.environ['BACKEND_DATOS'] = 'memoria'
+
+import app as aplicacion  # noqa: E402
+from flask_restx import marshal  # noqa: E402
+from serializacion import codificar_json, orjson  # noqa: E402
+
+
+class DocumentoPrueba:
+    """Lo mínimo de un DocumentSnapshot que usan los serializadores."""
+
+    __slots__ = ('id', '_datos')
+
+    def __init__(self, doc_id, datos):
+        self.id = doc_id
+        self._datos = datos
+
+    def to_dict(self):
+        return self._datos
+
+
+def generar_documentos(cantidad):
+    docs = []
+    for i in range(cantidad):
+        datos = {
+            'nombre': f'Propiedad {i}',
+            'precio': 50000 + (i * 137) % 450000,
+            'ubicacion': f'Sector {i % 25}',
+            'descripcion': f'Propiedad de prueba número {i}',
+            'habitaciones': 1 + i % 5,
+            'banos': 1 + i % 3,
+            'vendedor_id': f'vendedor{i % 20}'
+        }
+        if i % 2:
+            # La mitad tiene las variantes de la imagen; a la otra le faltan campos y usa los valores por defecto
+            datos.update(imagen_url=f'https://example.com/{i}.webp', imagen_estado='lista', imagenes={
+                'miniatura': f'https://example.com/{i}-m.webp',
+                'tarjeta': f'https://example.com/{i}-t.webp',
+                'completa': f'https://example.com/{i}.webp'
+            })
+        docs.append(DocumentoPrueba(f'bien{i:07d}', datos))
+    return docs
+
+
+def ruta_restx(docs):
+    # Lo que hacía GET /bienes_raices: dict con defectos, marshal() y el encoder de flask-restx
+    bienes_raices = [aplicacion.serializar_bien_raiz(doc) for doc in docs]
+    return (json.dumps(marshal(bienes_raices, aplicacion.bien_raiz_model)) + '\n').encode('utf-8')
+
+
+def ruta_rapida(docs):
+    return codificar_json(aplicacion.serializador_bienes.filas(docs))
+
+
+def medir(funcion, docs, repeticiones):
+    # Se informa la mejor de las repeticiones para reducir el ruido
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(docs)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara la serialización con marshal() y la ruta rápida')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000], help='Cantidades de filas a medir')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Repeticiones por medición')
+    parser.add_argument('--json', action='store_true', help='Imprimir los resultados en JSON')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    resultados = []
+    for cantidad in args.filas:
+        docs = generar_documentos(cantidad)
+        tiempo_restx, cuerpo_restx = medir(ruta_restx, docs, args.repeticiones)
+        tiempo_rapido, cuerpo_rapido = medir(ruta_rapida, docs, args.repeticiones)
+        if json.loads(cuerpo_restx) != json.loads(cuerpo_rapido):
+            raise AssertionError(f'Las rutas producen JSON distinto con {cantidad} filas')
+        resultados.append({
+            'filas': cantidad,
+            'restx_ms': tiempo_restx * 1000,
+            'rapida_ms': tiempo_rapido * 1000,
+            'aceleracion': tiempo_restx / tiempo_rapido if tiempo_rapido else 0.0,
+            'restx_bytes': len(cuerpo_restx),
+            'rapida_bytes': len(cuerpo_rapido)
+        })
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"Encoder JSON de la ruta rápida: {'orjson' if orjson is not None else 'json'}")
+    encabezado = f"{'Filas':>8}{'restx ms':>12}{'rápida ms':>12}{'x':>8}{'restx KB':>11}{'rápida KB':>11}"
+    print(encabezado)
+    print('-' * len(encabezado))
+    for r in resultados:
+        print(f"{r['filas']:>8}{r['restx_ms']:>12.1f}{r['rapida_ms']:>12.1f}{r['aceleracion']:>8.1f}"
+              f"{r['restx_bytes'] / 1024:>11.0f}{r['rapida_bytes'] / 1024:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Caché de lectura para las consultas de bienes raíces.
+
+Guarda los resultados en un LRU local con TTL por entrada y, opcionalmente,
+en un backend compartido (Redis) para que varios workers usen la misma caché.
+Las lecturas concurrentes de la misma clave se agrupan en una sola carga.
+
+Las claves no se invalidan una por una: quien las arma incluye la versión de su
+espacio (ej. bien_raiz:v3:<id>) y al escribir se incrementa esa versión. Las
+entradas de versiones anteriores expiran solas por TTL.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # El backend compartido es opcional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class BackendRedis:
+    """Backend compartido entre procesos sobre Redis.
+
+    Las claves de versión expiran tras ttl_versiones segundos sin leerse ni
+    incrementarse. Debe ser bastante mayor que el TTL de las entradas: cuando
+    una versión expira y vuelve a empezar desde 0, las entradas que la usaban
+    ya expiraron también.
+    """
+
+    def __init__(self, url, prefijo='bienes_raices:', ttl_versiones=24 * 3600):
+        if redis is None:
+            raise RuntimeError("Se configuró CACHE_REDIS_URL pero el paquete 'redis' no está instalado")
+        self.cliente = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        self.ttl_versiones = int(ttl_versiones)
+
+    def obtener(self, clave):
+        valor = self.cliente.get(self.prefijo + clave)
+        return None if valor is None else json.loads(valor)
+
+    def guardar(self, clave, valor, ttl):
+        self.cliente.set(self.prefijo + clave, json.dumps(valor, default=str), ex=max(1, int(ttl)))
+
+    def version(self, espacio):
+        # Cada lectura renueva la expiración, en el mismo viaje a Redis
+        clave = self.prefijo + 'version:' + espacio
+        valor, _ = self.cliente.pipeline(transaction=False).get(clave).expire(clave, self.ttl_versiones).execute()
+        return int(valor) if valor is not None else 0
+
+    def incrementar_version(self, espacio):
+        clave = self.prefijo + 'version:' + espacio
+        version, _ = self.cliente.pipeline(transaction=False).incr(clave).expire(clave, self.ttl_versiones).execute()
+        return int(version)
+
+
+class _Vuelo:
+    """Carga en curso de una clave; los demás hilos esperan su resultado."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+class CacheLRU:
+    """LRU en memoria con TTL por entrada y carga de tipo read-through.
+
+    Sin backend compartido las versiones se guardan en un LRU local de
+    capacidad_versiones espacios. Los espacios sin entrada usan una versión base
+    mayor que todas las desalojadas, así nunca se repite una versión que pueda
+    seguir en caché.
+    """
+
+    def __init__(self, capacidad=1024, ttl=60, backend=None, capacidad_versiones=None):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.backend = backend
+        self.capacidad_versiones = capacidad * 4 if capacidad_versiones is None else capacidad_versiones
+        self._entradas = OrderedDict()  # clave -> (expira_en, valor)
+        self._vuelos = {}
+        self._versiones = OrderedDict()  # espacio -> versión
+        self._version_base = 0  # Versión de los espacios sin entrada
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def _leer_local(self, clave):
+        # Debe llamarse con el lock tomado
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        expira_en, valor = entrada
+        if expira_en <= time.monotonic():
+            del self._entradas[clave]
+            self.desalojos += 1
+            return None
+        self._entradas.move_to_end(clave)
+        return valor
+
+    def _guardar_local(self, clave, valor, ttl):
+        # Debe llamarse con el lock tomado
+        self._entradas[clave] = (time.monotonic() + ttl, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+            self.desalojos += 1
+
+    def obtener(self, clave, cargar, ttl=None):
+        """Devuelve el valor de la clave; si no está, lo carga con cargar() una sola vez.
+
+        Los valores None no se guardan, así un documento inexistente no queda en caché.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            valor = self._leer_local(clave)
+            if valor is not None:
+                self.aciertos += 1
+                return valor
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+
+        if not lider:
+            # Otro hilo ya está cargando esta clave: se espera su resultado
+            vuelo.evento.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            with self._lock:
+                self.aciertos += 1
+            return vuelo.valor
+
+        try:
+            valor = None
+            if self.backend is not None:
+                try:
+                    valor = self.backend.obtener(clave)
+                except Exception:
+                    logger.exception("Error al leer del backend compartido de caché")
+            if valor is None:
+                valor = cargar()
+                if valor is not None and self.backend is not None:
+                    try:
+                        self.backend.guardar(clave, valor, ttl)
+                    except Exception:
+                        logger.exception("Error al escribir en el backend compartido de caché")
+            with self._lock:
+                self.fallos += 1
+                if valor is not None:
+                    self._guardar_local(clave, valor, ttl)
+            vuelo.valor = valor
+            return valor
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.evento.set()
+
+    def version(self, espacio):
+        """Versión actual de un espacio de claves (ej. los listados)."""
+        if self.backend is not None:
+            try:
+                return self.backend.version(espacio)
+            except Exception:
+                logger.exception("Error al leer la versión del backend compartido de caché")
+        with self._lock:
+            return self._version_local(espacio)
+
+    def _version_local(self, espacio):
+        # Debe llamarse con el lock tomado
+        version = self._versiones.get(espacio)
+        if version is None:
+            return self._version_base
+        self._versiones.move_to_end(espacio)
+        return version
+
+    def incrementar_version(self, espacio):
+        """Invalida de una vez todas las claves que incluyen la versión del espacio.
+
+        Devuelve la nueva versión, la del backend compartido si está configurado.
+        """
+        with self._lock:
+            version = self._versiones[espacio] = self._version_local(espacio) + 1
+            if len(self._versiones) > self.capacidad_versiones:
+                _, desalojada = self._versiones.popitem(last=False)
+                # El espacio desalojado vuelve con una versión mayor que la que tenía
+                self._version_base = max(self._version_base, desalojada + 1)
+        if self.backend is not None:
+            try:
+                return self.backend.incrementar_version(espacio)
+            except Exception:
+                logger.exception("Error al incrementar la versión en el backend compartido de caché")
+        return version
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'entradas': len(self._entradas),
+                'capacidad': self.capacidad,
+                'ttl': self.ttl,
+                'backend_compartido': self.backend is not None
+            }
+
+
+def crear_cache(capacidad=1024, ttl=60, redis_url=None, ttl_versiones=24 * 3600):
+    backend = BackendRedis(redis_url, ttl_versiones=ttl_versiones) if redis_url else None
+    return CacheLRU(capacidad=capacidad, ttl=ttl, backend=backend)
@@ -0,0 +1,52 @@
+"""Clientes de Firebase creados de forma perezosa, uno por proceso.
+
+Importar la app no lee credenciales ni abre conexiones: cada cliente se crea
+en su primer uso y se reutiliza en ese proceso. Los canales gRPC de Firestore
+no sobreviven a un fork, así que después de un fork el proceso hijo descarta
+el cliente heredado y crea el suyo en el primer uso.
+"""
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ClientePerezoso:
+    """Proxy que crea el cliente con la fábrica en el primer acceso a un atributo."""
+
+    def __init__(self, fabrica, nombre):
+        self._fabrica = fabrica
+        self._nombre = nombre
+        self._cliente = None
+        self._lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._descartar)
+
+    def _descartar(self):
+        # En el hijo el lock puede haber quedado tomado por un hilo que no existe
+        if self._cliente is not None:
+            logger.warning("Se descarta el cliente %s creado antes del fork", self._nombre)
+        self._cliente = None
+        self._lock = threading.Lock()
+
+    @property
+    def creado(self):
+        return self._cliente is not None
+
+    def obtener(self):
+        cliente = self._cliente
+        if cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    self._cliente = self._fabrica()
+                    logger.info("Cliente %s creado en el proceso %d", self._nombre, os.getpid())
+                cliente = self._cliente
+        return cliente
+
+    def __getattr__(self, nombre):
+        return getattr(self.obtener(), nombre)
+
+    def __repr__(self):
+        estado = 'creado' if self.creado else 'sin crear'
+        return f'<ClientePerezoso {self._nombre} ({estado})>'
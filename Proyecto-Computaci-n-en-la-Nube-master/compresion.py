@@ -0,0 +1,60 @@
+"""Compresión gzip/brotli de las respuestas de la API.
+
+Solo se comprimen las respuestas 200 de tipos de texto que superan el umbral;
+las respuestas en streaming y los archivos estáticos se dejan como están.
+Brotli se usa si el paquete está instalado y el cliente lo acepta.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Sin brotli solo se ofrece gzip
+    brotli = None
+
+TIPOS_COMPRIMIBLES = ('application/json', 'application/javascript', 'application/x-ndjson', 'text/')
+
+
+def codificacion_aceptada():
+    """Devuelve 'br', 'gzip' o None según el Accept-Encoding de la petición."""
+    aceptadas = request.accept_encodings
+    if brotli is not None and aceptadas['br']:
+        return 'br'
+    if aceptadas['gzip']:
+        return 'gzip'
+    return None
+
+
+def instalar_compresion(app, umbral=1024, nivel_gzip=6, calidad_brotli=4):
+    """Registra un after_request que comprime las respuestas que superan el umbral en bytes."""
+
+    @app.after_request
+    def comprimir_respuesta(respuesta):
+        if (respuesta.status_code != 200
+                or respuesta.direct_passthrough
+                or respuesta.is_streamed
+                or 'Content-Encoding' in respuesta.headers
+                or not respuesta.mimetype.startswith(TIPOS_COMPRIMIBLES)):
+            return respuesta
+
+        respuesta.vary.add('Accept-Encoding')
+        codificacion = codificacion_aceptada()
+        if codificacion is None or respuesta.content_length is None or respuesta.content_length < umbral:
+            return respuesta
+
+        cuerpo = respuesta.get_data()
+        if codificacion == 'br':
+            comprimido = brotli.compress(cuerpo, quality=calidad_brotli)
+        else:
+            comprimido = gzip.compress(cuerpo, compresslevel=nivel_gzip)
+        respuesta.set_data(comprimido)
+        respuesta.headers['Content-Encoding'] = codificacion
+
+        # Cada codificación es una representación distinta, así que lleva su propio ETag
+        etag, debil = respuesta.get_etag()
+        if etag:
+            respuesta.set_etag(f'{etag}-{codificacion}', weak=debil)
+        return respuesta
+
+    return comprimir_respuesta
@@ -0,0 +1,159 @@
+"""Geohash y cálculo de distancias para la búsqueda de bienes raíces cercanos.
+
+Cada bien raíz con coordenadas guarda su geohash; como los puntos cercanos
+comparten prefijo, un radio o un rectángulo se cubre con unas pocas consultas
+por rango sobre ese campo. Los resultados se filtran después con la distancia
+exacta, porque las celdas cubren más área que la pedida.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION_GEOHASH = 9  # Celdas de unos 5 m
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO_LATITUD = 111.32
+# Máximo de celdas con que se cubre un área; con más se usa una precisión menor
+MAXIMO_CELDAS = 16
+
+
+def validar_coordenadas(latitud, longitud):
+    if latitud is None or longitud is None:
+        raise ValueError("Se deben indicar la latitud y la longitud juntas")
+    if not -90 <= latitud <= 90:
+        raise ValueError(f"Latitud fuera de rango: {latitud}")
+    if not -180 <= longitud <= 180:
+        raise ValueError(f"Longitud fuera de rango: {longitud}")
+
+
+def codificar(latitud, longitud, precision=PRECISION_GEOHASH):
+    """Devuelve el geohash del punto con la cantidad de caracteres indicada."""
+    rango_lat, rango_lng = [-90.0, 90.0], [-180.0, 180.0]
+    caracteres = []
+    bits, valor, par = 0, 0, True
+    while len(caracteres) < precision:
+        # Los bits pares dividen la longitud y los impares la latitud
+        rango, coordenada = (rango_lng, longitud) if par else (rango_lat, latitud)
+        medio = (rango[0] + rango[1]) / 2
+        if coordenada >= medio:
+            valor = valor * 2 + 1
+            rango[0] = medio
+        else:
+            valor *= 2
+            rango[1] = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(BASE32[valor])
+            bits, valor = 0, 0
+    return ''.join(caracteres)
+
+
+def tamano_celda(precision):
+    """Devuelve (alto, ancho) en grados de una celda de geohash."""
+    bits = precision * 5
+    bits_lng = (bits + 1) // 2
+    return 180.0 / (1 << (bits - bits_lng)), 360.0 / (1 << bits_lng)
+
+
+def distancia_km(latitud1, longitud1, latitud2, longitud2):
+    """Distancia de haversine entre dos puntos."""
+    lat1, lat2 = math.radians(latitud1), math.radians(latitud2)
+    dlat = lat2 - lat1
+    dlng = math.radians(longitud2 - longitud1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def rectangulo_de_radio(latitud, longitud, radio_km):
+    """Devuelve (lat_min, lng_min, lat_max, lng_max) que contiene el círculo."""
+    delta_lat = radio_km / KM_POR_GRADO_LATITUD
+    coseno = math.cos(math.radians(latitud))
+    delta_lng = 180.0 if coseno < 1e-6 else min(180.0, radio_km / (KM_POR_GRADO_LATITUD * coseno))
+    lat_min, lat_max = max(-90.0, latitud - delta_lat), min(90.0, latitud + delta_lat)
+    if lat_min == -90.0 or lat_max == 90.0:
+        # El círculo incluye un polo: abarca todas las longitudes
+        return lat_min, -180.0, lat_max, 180.0
+    return lat_min, longitud - delta_lng, lat_max, longitud + delta_lng
+
+
+def diagonal_km(rectangulo):
+    """Diagonal aproximada del rectángulo, con el ancho medido sobre su paralelo más largo."""
+    lat_min, lng_min, lat_max, lng_max = rectangulo
+    ancho = lng_max - lng_min if lng_min <= lng_max else lng_max - lng_min + 360  # Cruza el antimeridiano
+    latitud_mas_larga = 0.0 if lat_min <= 0 <= lat_max else min(abs(lat_min), abs(lat_max))
+    ancho_km = min(ancho, 360.0) * KM_POR_GRADO_LATITUD * math.cos(math.radians(latitud_mas_larga))
+    return math.hypot((lat_max - lat_min) * KM_POR_GRADO_LATITUD, ancho_km)
+
+
+def dentro_del_rectangulo(latitud, longitud, rectangulo):
+    lat_min, lng_min, lat_max, lng_max = rectangulo
+    if not lat_min <= latitud <= lat_max:
+        return False
+    if lng_min <= lng_max:
+        return lng_min <= longitud <= lng_max
+    return longitud >= lng_min or longitud <= lng_max  # Cruza el antimeridiano
+
+
+def _partes_rectangulo(rectangulo):
+    # Normaliza las longitudes a [-180, 180] separando el rectángulo si cruza el antimeridiano
+    lat_min, lng_min, lat_max, lng_max = rectangulo
+    if lng_max - lng_min >= 360:
+        return [(lat_min, -180.0, lat_max, 180.0)]
+    lng_min = (lng_min + 180) % 360 - 180
+    lng_max = (lng_max + 180) % 360 - 180
+    if lng_min <= lng_max:
+        return [(lat_min, lng_min, lat_max, lng_max)]
+    return [(lat_min, lng_min, lat_max, 180.0), (lat_min, -180.0, lat_max, lng_max)]
+
+
+def _indices(minimo, maximo, origen, tamano, cantidad):
+    inicio = min(cantidad - 1, int((minimo - origen) // tamano))
+    fin = min(cantidad - 1, int((maximo - origen) // tamano))
+    return range(inicio, fin + 1)
+
+
+def celdas_del_rectangulo(rectangulo, maximo_celdas=MAXIMO_CELDAS):
+    """Devuelve los geohash de la mayor precisión que cubren el rectángulo con pocas celdas."""
+    partes = _partes_rectangulo(rectangulo)
+    elegidas = None
+    for precision in range(1, PRECISION_GEOHASH + 1):
+        alto, ancho = tamano_celda(precision)
+        filas_totales, columnas_totales = round(180 / alto), round(360 / ancho)
+        celdas = []
+        for lat_min, lng_min, lat_max, lng_max in partes:
+            filas = _indices(lat_min, lat_max, -90.0, alto, filas_totales)
+            columnas = _indices(lng_min, lng_max, -180.0, ancho, columnas_totales)
+            if len(celdas) + len(filas) * len(columnas) > maximo_celdas:
+                celdas = None
+                break
+            for fila in filas:
+                for columna in columnas:
+                    # Se codifica el centro de la celda para obtener su geohash
+                    celdas.append(codificar(-90.0 + (fila + 0.5) * alto, -180.0 + (columna + 0.5) * ancho, precision))
+        if celdas is None:
+            break
+        elegidas = celdas
+    return sorted(set(elegidas or ['']))
+
+
+def _siguiente(geohash):
+    # El geohash que sigue en orden a este con la misma longitud, o None si es el último
+    caracteres = list(geohash)
+    for posicion in range(len(caracteres) - 1, -1, -1):
+        indice = BASE32.index(caracteres[posicion])
+        if indice < len(BASE32) - 1:
+            caracteres[posicion] = BASE32[indice + 1]
+            return ''.join(caracteres[:posicion + 1]) + BASE32[0] * (len(caracteres) - posicion - 1)
+    return None
+
+
+def rangos_de_celdas(celdas):
+    """Convierte los prefijos en rangos [inicio, fin) uniendo las celdas contiguas."""
+    rangos = []
+    for celda in sorted(celdas):
+        fin = _siguiente(celda) if celda else None
+        fin = fin if fin is not None else '~'  # '~' es mayor que cualquier carácter de BASE32
+        if rangos and rangos[-1][1] == celda:
+            rangos[-1] = (rangos[-1][0], fin)
+        else:
+            rangos.append((celda, fin))
+    return rangos
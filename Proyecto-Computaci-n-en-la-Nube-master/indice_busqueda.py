@@ -0,0 +1,323 @@
+"""Índice en memoria para buscar bienes raíces sin leer Firestore.
+
+Mantiene arreglos ordenados por cada campo por el que se puede ordenar
+(precio, habitaciones, banos, nombre y el id) y un índice invertido de tokens
+para los campos de texto (nombre, descripcion, ubicacion). Una búsqueda solo
+ordena la página pedida, no todos los resultados. Se actualiza de forma incremental desde las rutas de
+escritura o desde un listener de snapshots de Firestore. Sin listener, las
+escrituras de otros procesos se detectan por la versión de la colección y por
+la antigüedad de la carga, y el índice se recarga completo.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+
+CAMPOS_NUMERICOS = ('precio', 'habitaciones', 'banos')
+CAMPOS_TEXTO = ('nombre', 'descripcion', 'ubicacion')
+CAMPOS_ORDENABLES = CAMPOS_NUMERICOS + ('nombre',)
+# Sin un campo de orden los resultados se ordenan por id
+ORDEN_POR_DEFECTO = 'id'
+CAMPOS_ORDEN = CAMPOS_ORDENABLES + (ORDEN_POR_DEFECTO,)
+
+_SEPARADOR = re.compile(r'[^0-9a-z]+')
+# Bloques Unicode de marcas combinantes (tildes, diéresis, etc.) que deja la normalización NFKD
+_COMBINANTES = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+
+def tokenizar(texto):
+    """Pasa el texto a minúsculas sin tildes y lo separa en palabras."""
+    if not texto:
+        return []
+    texto = str(texto).lower()
+    # El texto ASCII no tiene tildes; el resto se normaliza y se le quitan las marcas con una regex
+    sin_tildes = texto if texto.isascii() else _COMBINANTES.sub('', unicodedata.normalize('NFKD', texto))
+    return [token for token in _SEPARADOR.split(sin_tildes) if token]
+
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _clave(campo, doc_id, datos):
+    # Clave de orden de un documento en el arreglo del campo; el id desempata y siempre va al final
+    if campo in CAMPOS_NUMERICOS:
+        return (_numero(datos.get(campo)), doc_id)
+    if campo == 'nombre':
+        return (str(datos.get('nombre') or '').lower(), doc_id)
+    return (doc_id,)
+
+
+class IndiceBienesRaices:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._recarga = threading.Lock()
+        self._reiniciar()
+        self.cargado = False
+        self.version = None  # Versión de la colección que refleja el índice
+        self.cargado_en = None
+
+    def _reiniciar(self):
+        self._documentos = {}  # id -> datos del bien raíz
+        self._ordenados = {campo: [] for campo in CAMPOS_ORDEN}  # [(valor, id)] ordenado
+        self._valores = {campo: {} for campo in CAMPOS_NUMERICOS}  # campo -> {id: valor numérico}
+        self._tokens = {}  # token -> set(ids)
+        self._vocabulario = []  # tokens ordenados para buscar por prefijo
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def cargar(self, documentos, version=None):
+        """Reconstruye el índice a partir de pares (id, datos).
+
+        Los arreglos y el vocabulario se arman sin orden y se ordenan una sola vez;
+        mientras tanto las búsquedas siguen usando el índice anterior.
+        """
+        nuevos = {}
+        for doc_id, datos in documentos:
+            datos = dict(datos)
+            datos['id'] = doc_id
+            nuevos[doc_id] = datos
+        ordenados = {campo: sorted(_clave(campo, doc_id, datos) for doc_id, datos in nuevos.items())
+                     for campo in CAMPOS_ORDEN}
+        valores = {campo: {clave[-1]: clave[0] for clave in ordenados[campo]} for campo in CAMPOS_NUMERICOS}
+        tokens = {}
+        for doc_id, datos in nuevos.items():
+            for token in self._tokens_de(datos):
+                ids = tokens.get(token)
+                if ids is None:
+                    ids = tokens[token] = set()
+                ids.add(doc_id)
+        vocabulario = sorted(tokens)
+        with self._lock:
+            self._documentos, self._ordenados, self._valores = nuevos, ordenados, valores
+            self._tokens, self._vocabulario = tokens, vocabulario
+            self.cargado = True
+            self.version = version
+            self.cargado_en = time.monotonic()
+
+    def _desactualizado(self, version, antiguedad_maxima, intervalo_minimo):
+        if not self.cargado:
+            return True
+        antiguedad = time.monotonic() - self.cargado_en
+        if antiguedad_maxima is not None and antiguedad > antiguedad_maxima:
+            return True
+        return version is not None and version != self.version and antiguedad >= intervalo_minimo
+
+    def asegurar_cargado(self, obtener_documentos, version=None, antiguedad_maxima=None, intervalo_minimo=0):
+        """Carga el índice la primera vez y lo recarga si quedó desactualizado.
+
+        Se recarga si la versión de la colección cambió (como mucho una vez cada
+        intervalo_minimo segundos) o si la carga tiene más de antiguedad_maxima
+        segundos. Mientras un hilo recarga, los demás buscan en el índice anterior.
+        """
+        if not self._desactualizado(version, antiguedad_maxima, intervalo_minimo):
+            return
+        if not self._recarga.acquire(blocking=not self.cargado):
+            return
+        try:
+            if self._desactualizado(version, antiguedad_maxima, intervalo_minimo):
+                # La colección se lee sin bloquear las búsquedas
+                self.cargar(obtener_documentos(), version)
+        finally:
+            self._recarga.release()
+
+    def avanzar_version(self, version):
+        """Registra una escritura propia ya aplicada al índice de forma incremental.
+
+        Si no hubo escrituras de otros procesos en el medio, el índice sigue al día
+        con la nueva versión y no hace falta recargarlo.
+        """
+        with self._lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def agregar(self, doc_id, datos):
+        """Agrega o reemplaza un bien raíz completo."""
+        with self._lock:
+            self._quitar(doc_id)
+            self._agregar(doc_id, datos)
+
+    def actualizar(self, doc_id, cambios):
+        """Aplica una actualización parcial a un bien raíz ya indexado."""
+        with self._lock:
+            actuales = self._documentos.get(doc_id)
+            if actuales is None:
+                return
+            datos = dict(actuales)
+            datos.update(cambios)
+            self._quitar(doc_id)
+            self._agregar(doc_id, datos)
+
+    def eliminar(self, doc_id):
+        with self._lock:
+            self._quitar(doc_id)
+
+    def _agregar(self, doc_id, datos):
+        datos = dict(datos)
+        datos['id'] = doc_id
+        self._documentos[doc_id] = datos
+        for campo in CAMPOS_NUMERICOS:
+            self._valores[campo][doc_id] = _numero(datos.get(campo))
+        for campo in CAMPOS_ORDEN:
+            bisect.insort(self._ordenados[campo], _clave(campo, doc_id, datos))
+        for token in self._tokens_de(datos):
+            ids = self._tokens.get(token)
+            if ids is None:
+                ids = self._tokens[token] = set()
+                bisect.insort(self._vocabulario, token)
+            ids.add(doc_id)
+
+    def _quitar(self, doc_id):
+        datos = self._documentos.pop(doc_id, None)
+        if datos is None:
+            return
+        for campo in CAMPOS_NUMERICOS:
+            self._valores[campo].pop(doc_id, None)
+        for campo in CAMPOS_ORDEN:
+            arreglo = self._ordenados[campo]
+            clave = _clave(campo, doc_id, datos)
+            posicion = bisect.bisect_left(arreglo, clave)
+            if posicion < len(arreglo) and arreglo[posicion] == clave:
+                del arreglo[posicion]
+        for token in self._tokens_de(datos):
+            ids = self._tokens.get(token)
+            if ids is None:
+                continue
+            ids.discard(doc_id)
+            if not ids:
+                del self._tokens[token]
+                posicion = bisect.bisect_left(self._vocabulario, token)
+                del self._vocabulario[posicion]
+
+    @staticmethod
+    def _tokens_de(datos):
+        tokens = set()
+        for campo in CAMPOS_TEXTO:
+            tokens.update(tokenizar(datos.get(campo)))
+        return tokens
+
+    def _limites(self, campo, minimo=None, maximo=None):
+        # Posiciones [inicio, fin) de los valores en [minimo, maximo] usando búsqueda binaria
+        arreglo = self._ordenados[campo]
+        inicio = 0 if minimo is None else bisect.bisect_left(arreglo, (minimo, ''))
+        fin = len(arreglo) if maximo is None else bisect.bisect_right(arreglo, (maximo, chr(0x10FFFF)))
+        return inicio, max(inicio, fin)
+
+    def _texto(self, tokens):
+        # Cada palabra debe coincidir exacto; la última también por prefijo (búsqueda mientras se escribe)
+        ids = None
+        for posicion, token in enumerate(tokens):
+            if posicion == len(tokens) - 1 and token.isalpha():
+                encontrados = self._prefijo(token)
+            else:
+                encontrados = self._tokens.get(token, set())
+            ids = set(encontrados) if ids is None else ids & encontrados
+            if not ids:
+                break
+        return ids
+
+    def _prefijo(self, token):
+        # Une los ids de todos los tokens del vocabulario que empiezan con el prefijo
+        ids = set()
+        posicion = bisect.bisect_left(self._vocabulario, token)
+        while posicion < len(self._vocabulario) and self._vocabulario[posicion].startswith(token):
+            ids |= self._tokens[self._vocabulario[posicion]]
+            posicion += 1
+        return ids
+
+    def buscar(self, texto=None, precio_min=None, precio_max=None, habitaciones_min=None,
+               banos_min=None, ordenar=None, descendente=False, offset=0, limite=20):
+        """Devuelve (total, resultados) con los bienes raíces que cumplen todos los filtros."""
+        campo_orden = ordenar if ordenar in CAMPOS_ORDENABLES else ORDEN_POR_DEFECTO
+        with self._lock:
+            rangos = []
+            if precio_min is not None or precio_max is not None:
+                rangos.append(('precio', precio_min, precio_max))
+            if habitaciones_min is not None:
+                rangos.append(('habitaciones', habitaciones_min, None))
+            if banos_min is not None:
+                rangos.append(('banos', banos_min, None))
+
+            # Un rango que incluye a todos los documentos no filtra nada
+            rangos = [rango for rango in rangos if self._tamano_rango(*rango) < len(self._documentos)]
+            tokens = tokenizar(texto)
+            ids = self._texto(tokens) if tokens else None
+            if ids is None and not rangos:
+                # Sin filtros la página sale directo del arreglo ordenado
+                arreglo = self._ordenados[campo_orden]
+                return len(arreglo), self._documentos_de(
+                    self._rebanada(arreglo, 0, len(arreglo), descendente, offset, limite))
+            if ids is None:
+                # Sin texto se parte del rango más selectivo, contado con búsqueda binaria
+                tamanos = [self._limites(*rango) for rango in rangos]
+                menor = min(range(len(rangos)), key=lambda i: tamanos[i][1] - tamanos[i][0])
+                inicio, fin = tamanos[menor]
+                campo = rangos.pop(menor)[0]
+                arreglo = self._ordenados[campo]
+                if not rangos and campo == campo_orden:
+                    # El rango ya está ordenado por el campo pedido
+                    return fin - inicio, self._documentos_de(
+                        self._rebanada(arreglo, inicio, fin, descendente, offset, limite))
+                ids = {clave[-1] for clave in arreglo[inicio:fin]}
+            for campo, minimo, maximo in rangos:
+                inicio, fin = self._limites(campo, minimo, maximo)
+                if len(ids) * 4 < fin - inicio:
+                    # Pocos candidatos: se verifica cada uno con los valores ya convertidos
+                    valores = self._valores[campo]
+                    minimo = float('-inf') if minimo is None else minimo
+                    maximo = float('inf') if maximo is None else maximo
+                    ids = {doc_id for doc_id in ids if minimo <= valores[doc_id] <= maximo}
+                else:
+                    # Rango más chico que los candidatos: se intersectan como conjuntos
+                    ids = ids.intersection([clave[-1] for clave in self._ordenados[campo][inicio:fin]])
+            return len(ids), self._documentos_de(self._pagina(ids, campo_orden, descendente, offset, limite))
+
+    def _tamano_rango(self, campo, minimo, maximo):
+        inicio, fin = self._limites(campo, minimo, maximo)
+        return fin - inicio
+
+    @staticmethod
+    def _rebanada(arreglo, inicio, fin, descendente, offset, limite):
+        # Ids de la página dentro de arreglo[inicio:fin], que ya está ordenado
+        if descendente:
+            hasta = max(inicio, fin - offset)
+            return [clave[-1] for clave in reversed(arreglo[max(inicio, hasta - limite):hasta])]
+        desde = min(fin, inicio + offset)
+        return [clave[-1] for clave in arreglo[desde:min(fin, desde + limite)]]
+
+    def _pagina(self, ids, campo, descendente, offset, limite):
+        # Ids de la página entre los candidatos, sin ordenarlos a todos
+        cantidad = offset + limite
+        if len(ids) * 8 < len(self._documentos):
+            # Pocos candidatos: se eligen los primeros con un heap
+            claves = (_clave(campo, doc_id, self._documentos[doc_id]) for doc_id in ids)
+            elegidas = heapq.nlargest(cantidad, claves) if descendente else heapq.nsmallest(cantidad, claves)
+            return [clave[-1] for clave in elegidas[offset:]]
+        # Muchos candidatos: se recorre el arreglo ordenado hasta completar la página
+        arreglo = self._ordenados[campo]
+        pagina = []
+        for clave in reversed(arreglo) if descendente else arreglo:
+            if clave[-1] in ids:
+                pagina.append(clave[-1])
+                if len(pagina) == cantidad:
+                    break
+        return pagina[offset:]
+
+    def _documentos_de(self, ids):
+        return [dict(self._documentos[doc_id]) for doc_id in ids]
+
+    def aplicar_snapshot(self, cambios):
+        """Aplica los cambios de un listener on_snapshot de Firestore."""
+        for cambio in cambios:
+            tipo = cambio.type.name
+            if tipo == 'REMOVED':
+                self.eliminar(cambio.document.id)
+            else:
+                self.agregar(cambio.document.id, cambio.document.to_dict() or {})
+        self.cargado = True
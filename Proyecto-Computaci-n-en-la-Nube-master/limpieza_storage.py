@@ -0,0 +1,200 @@
+"""Limpieza de los blobs de imágenes que ya no usa ningún bien raíz.
+
+Al eliminar bienes raíces, las imágenes que quedan sin referencias se borran
+en segundo plano. El barrido recorre las imágenes bajo imagenes/ y elimina los
+blobs que ningún bien raíz referencia. Con --incluir-legado también considera
+las imágenes sueltas en la raíz del bucket que subía la versión anterior; los
+demás prefijos nunca se tocan.
+
+Uso del barrido:
+    python Proyecto-Computaci-n-en-la-Nube-master/limpieza_storage.py --gracia-minutos 60 [--simular] [--incluir-legado]
+"""
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+
+from procesamiento_imagenes import COLECCION_IMAGENES
+
+logger = logging.getLogger(__name__)
+
+# Extensiones de las imágenes que la versión anterior subía a la raíz del bucket
+EXTENSIONES_LEGADO = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp')
+
+
+def nombre_blob_de_url(url):
+    # Extrae el nombre del blob de una URL https://firebasestorage.googleapis.com/v0/b/<bucket>/o/<nombre>?alt=media
+    if not url or '/o/' not in url:
+        return None
+    return unquote(url.split('/o/', 1)[1].split('?', 1)[0])
+
+
+def es_imagen_legado(nombre):
+    # Solo objetos en la raíz del bucket con extensión de imagen
+    return '/' not in nombre and nombre.lower().endswith(EXTENSIONES_LEGADO)
+
+
+class LimpiadorStorage:
+    def __init__(self, db, bucket, transaccional, workers=4):
+        self.db = db
+        self.bucket = bucket
+        self._ejecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='limpieza')
+        # Los blobs se borran en otro pool: _liberar corre en _ejecutor y espera esos borrados,
+        # así que compartir el pool lo bloquearía cuando se liberan más imágenes que workers
+        self._borrados = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='limpieza-blobs')
+        self._lock = threading.Lock()
+        self.imagenes_liberadas = 0
+        self.blobs_eliminados = 0
+        self.errores = 0
+
+        @transaccional
+        def reclamar(transaccion, imagen_ref):
+            # Marca la imagen como 'eliminando' solo si nadie la usa; así no se reutiliza mientras se borra
+            registro = imagen_ref.get(transaction=transaccion)
+            if not registro.exists:
+                return False
+            datos = registro.to_dict()
+            if datos.get('referencias', 0) > 0 or datos.get('estado') == 'pendiente':
+                return False
+            transaccion.update(imagen_ref, {'estado': 'eliminando'})
+            return True
+
+        self._reclamar = reclamar
+
+    def programar_liberacion(self, hashes):
+        """Borra en segundo plano las imágenes de estos hashes que quedaron sin referencias."""
+        for imagen_hash in hashes:
+            self._ejecutor.submit(self._liberar, imagen_hash)
+
+    def _liberar(self, imagen_hash):
+        try:
+            imagen_ref = self.db.collection(COLECCION_IMAGENES).document(imagen_hash)
+            if not self._reclamar(self.db.transaction(), imagen_ref):
+                return False
+            self.borrar_blobs(self.bucket.list_blobs(prefix=f'{COLECCION_IMAGENES}/{imagen_hash}/'))
+            imagen_ref.delete()
+            with self._lock:
+                self.imagenes_liberadas += 1
+            return True
+        except Exception:
+            logger.exception("Error al liberar la imagen %s", imagen_hash)
+            with self._lock:
+                self.errores += 1
+            return False
+
+    def borrar_blobs(self, blobs):
+        # Los blobs se borran en paralelo; un blob que ya no existe no es un error
+        def borrar(blob):
+            try:
+                blob.delete()
+                return 1
+            except Exception:
+                logger.warning("No se pudo borrar el blob %s", blob.name, exc_info=True)
+                return 0
+
+        eliminados = sum(self._borrados.map(borrar, list(blobs)))
+        with self._lock:
+            self.blobs_eliminados += eliminados
+        return eliminados
+
+    def barrer(self, gracia=timedelta(hours=1), simular=False, incluir_legado=False):
+        """Elimina los blobs que ningún bien raíz referencia y las imágenes sin referencias.
+
+        Los blobs modificados dentro del período de gracia se ignoran para no
+        borrar subidas en curso. Con simular=True solo se informa. Con
+        incluir_legado=True también se borran las imágenes sueltas en la raíz
+        del bucket que ningún bien raíz usa.
+        """
+        limite = datetime.now(timezone.utc) - gracia
+        hashes_usados, nombres_usados = set(), set()
+        ultimo = None
+        query = self.db.collection('bienes_raices').order_by('__name__').select(['imagen_hash', 'imagen_url'])
+        while True:
+            pagina = query if ultimo is None else query.start_after(ultimo)
+            docs = list(pagina.limit(500).stream())
+            for doc in docs:
+                datos = doc.to_dict() or {}
+                if datos.get('imagen_hash'):
+                    hashes_usados.add(datos['imagen_hash'])
+                nombre = nombre_blob_de_url(datos.get('imagen_url'))
+                if nombre:
+                    nombres_usados.add(nombre)
+            if len(docs) < 500:
+                break
+            ultimo = docs[-1]
+
+        registros = {doc.id: doc.to_dict() for doc in self.db.collection(COLECCION_IMAGENES).stream()}
+        huerfanos, sin_referencias, desfasadas = [], set(), []
+        for imagen_hash, datos in registros.items():
+            if datos.get('referencias', 0) <= 0 and datos.get('estado') != 'pendiente':
+                sin_referencias.add(imagen_hash)
+            elif imagen_hash not in hashes_usados and datos.get('referencias', 0) > 0:
+                # El contador no coincide con los bienes raíces: se informa pero no se borra
+                desfasadas.append(imagen_hash)
+
+        blobs = self.bucket.list_blobs(prefix=f'{COLECCION_IMAGENES}/')
+        if incluir_legado:
+            blobs = itertools.chain(blobs, (blob for blob in self.bucket.list_blobs() if es_imagen_legado(blob.name)))
+        for blob in blobs:
+            actualizado = getattr(blob, 'updated', None)
+            if actualizado is not None and actualizado > limite:
+                continue
+            partes = blob.name.split('/')
+            if partes[0] == COLECCION_IMAGENES and len(partes) > 2:
+                imagen_hash = partes[1]
+                if imagen_hash in hashes_usados or imagen_hash in sin_referencias:
+                    continue
+                if imagen_hash in registros:
+                    continue
+                huerfanos.append(blob)
+            elif len(partes) == 1 and blob.name not in nombres_usados:
+                # Imagen suelta de la versión anterior que ningún bien raíz usa
+                huerfanos.append(blob)
+
+        reporte = {
+            'blobs_huerfanos': [blob.name for blob in huerfanos],
+            'imagenes_sin_referencias': sorted(sin_referencias),
+            'imagenes_desfasadas': sorted(desfasadas),
+            'incluye_legado': incluir_legado,
+            'simulado': simular
+        }
+        if not simular:
+            reporte['blobs_eliminados'] = self.borrar_blobs(huerfanos)
+            reporte['imagenes_liberadas'] = sum(1 for imagen_hash in sin_referencias if self._liberar(imagen_hash))
+        return reporte
+
+    def cerrar(self, esperar=True):
+        self._ejecutor.shutdown(wait=esperar)
+        self._borrados.shutdown(wait=esperar)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'imagenes_liberadas': self.imagenes_liberadas,
+                'blobs_eliminados': self.blobs_eliminados,
+                'errores': self.errores
+            }
+
+
+def main():
+    import argparse
+    import json
+
+    import app as aplicacion
+
+    parser = argparse.ArgumentParser(description='Elimina los blobs de imágenes que ningún bien raíz usa')
+    parser.add_argument('--gracia-minutos', type=float, default=60, help='Ignorar los blobs modificados en este período')
+    parser.add_argument('--simular', action='store_true', help='Solo informar, sin borrar')
+    parser.add_argument('--incluir-legado', action='store_true',
+                        help='Considerar también las imágenes sueltas en la raíz del bucket')
+    args = parser.parse_args()
+
+    reporte = aplicacion.limpiador_storage.barrer(gracia=timedelta(minutes=args.gracia_minutos), simular=args.simular,
+                                                  incluir_legado=args.incluir_legado)
+    print(json.dumps(reporte, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
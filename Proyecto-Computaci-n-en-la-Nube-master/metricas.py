@@ -0,0 +1,366 @@
+"""Métricas de latencia de la API y de las llamadas a Firestore y Storage.
+
+Registra un histograma de latencia por ruta y estado HTTP, y envuelve los
+clientes de Firestore y Storage para contar llamadas, documentos leídos y
+escritos y bytes transferidos, midiendo el tiempo de cada operación. Todo se
+exporta en el formato de texto de Prometheus; opcionalmente se registra en el
+log el desglose de las peticiones que superan un umbral de duración.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas en segundos (los mismos que usan por defecto los clientes de Prometheus)
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Métodos de cada tipo de objeto que devuelven otro objeto a envolver, sin llamar al backend
+NAVEGACION = {
+    'cliente': {'collection': 'consulta', 'document': 'referencia', 'batch': 'lote', 'transaction': 'lote'},
+    'consulta': dict(dict.fromkeys(('where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select', 'start_after',
+                                    'start_at', 'end_before', 'end_at'), 'consulta'), document='referencia'),
+    'referencia': {'collection': 'consulta', 'parent': 'consulta'},
+    'snapshot': {'reference': 'referencia'},
+    'bucket': {'blob': 'blob'},
+    'lote': {},
+    'blob': {}
+}
+
+# Métodos que llaman al backend: nombre -> (operación, cómo se cuenta)
+OPERACIONES = {
+    'cliente': {'get_all': ('get_all', 'lecturas')},
+    'consulta': {'stream': ('stream', 'lecturas'), 'get': ('get', 'lecturas'), 'add': ('add', 'agregar')},
+    'referencia': {'get': ('get', 'lectura'), 'set': ('set', 'escritura'), 'update': ('update', 'escritura'),
+                   'create': ('create', 'escritura'), 'delete': ('delete', 'escritura')},
+    'snapshot': {},
+    # Las escrituras de un lote se cuentan al agregarlas; el viaje al servidor es el commit
+    'lote': {'set': ('set', 'escritura'), 'update': ('update', 'escritura'), 'create': ('create', 'escritura'),
+             'delete': ('delete', 'escritura'), 'get': ('get', 'lecturas'), 'commit': ('commit', 'llamada'),
+             '_begin': ('begin', 'llamada'), '_commit': ('commit', 'llamada'), '_confirmar': ('commit', 'llamada')},
+    'bucket': {'get_blob': ('get_blob', 'blob'), 'list_blobs': ('list_blobs', 'blobs')},
+    'blob': {'upload_from_string': ('upload', 'subida'), 'upload_from_file': ('upload', 'subida_archivo'),
+             'download_as_bytes': ('download', 'bajada'), 'download_as_string': ('download', 'bajada'),
+             'delete': ('delete', 'llamada'), 'make_public': ('make_public', 'llamada'),
+             'exists': ('exists', 'llamada'), 'reload': ('reload', 'llamada')}
+}
+
+# Registro de la petición en curso; los hilos en segundo plano no tienen uno
+_registro_actual = contextvars.ContextVar('registro_metricas', default=None)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=''):
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class Histograma:
+    """Histograma con los límites fijos de LIMITES_HISTOGRAMA; no es seguro entre hilos por sí solo."""
+
+    __slots__ = ('conteos', 'suma', 'total')
+
+    def __init__(self):
+        self.conteos = [0] * (len(LIMITES_HISTOGRAMA) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(LIMITES_HISTOGRAMA, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas, valores):
+        acumulado = 0
+        for limite, conteo in zip(LIMITES_HISTOGRAMA + ('+Inf',), self.conteos):
+            acumulado += conteo
+            le = f'le="{limite}"'
+            yield f'{nombre}_bucket{_etiquetas(etiquetas, valores, le)} {acumulado}'
+        yield f'{nombre}_sum{_etiquetas(etiquetas, valores)} {self.suma}'
+        yield f'{nombre}_count{_etiquetas(etiquetas, valores)} {self.total}'
+
+
+class RegistroPeticion:
+    """Acumula las operaciones del backend hechas durante una petición."""
+
+    def __init__(self):
+        self.operaciones = {}  # (servicio, operacion) -> [llamadas, segundos]
+        self.documentos_leidos = 0
+        self.documentos_escritos = 0
+        self.bytes = 0
+
+    def agregar(self, servicio, operacion, duracion, leidos, escritos, transferidos):
+        acumulado = self.operaciones.setdefault((servicio, operacion), [0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += duracion
+        self.documentos_leidos += leidos
+        self.documentos_escritos += escritos
+        self.bytes += transferidos
+
+    def por_servicio(self, servicio):
+        llamadas = sum(v[0] for (s, _), v in self.operaciones.items() if s == servicio)
+        segundos = sum(v[1] for (s, _), v in self.operaciones.items() if s == servicio)
+        return llamadas, segundos
+
+    def desglose(self):
+        return ', '.join(f'{servicio}.{operacion} {llamadas}x {segundos * 1000:.1f} ms'
+                         for (servicio, operacion), (llamadas, segundos)
+                         in sorted(self.operaciones.items(), key=lambda item: -item[1][1]))
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peticiones = {}  # (metodo, ruta, estado) -> Histograma
+        self._operaciones = {}  # (servicio, operacion) -> Histograma
+        self._errores = {}  # (servicio, operacion) -> cantidad
+        self._documentos = {'leidos': 0, 'escritos': 0}
+        self._bytes = {'subida': 0, 'bajada': 0}
+
+    def observar_peticion(self, metodo, ruta, estado, duracion):
+        with self._lock:
+            clave = (metodo, ruta, str(estado))
+            histograma = self._peticiones.get(clave)
+            if histograma is None:
+                histograma = self._peticiones[clave] = Histograma()
+            histograma.observar(duracion)
+
+    def registrar_operacion(self, servicio, operacion, duracion, leidos=0, escritos=0,
+                            subidos=0, bajados=0, error=False):
+        with self._lock:
+            clave = (servicio, operacion)
+            histograma = self._operaciones.get(clave)
+            if histograma is None:
+                histograma = self._operaciones[clave] = Histograma()
+            histograma.observar(duracion)
+            if error:
+                self._errores[clave] = self._errores.get(clave, 0) + 1
+            self._documentos['leidos'] += leidos
+            self._documentos['escritos'] += escritos
+            self._bytes['subida'] += subidos
+            self._bytes['bajada'] += bajados
+        registro = _registro_actual.get()
+        if registro is not None:
+            registro.agregar(servicio, operacion, duracion, leidos, escritos, subidos + bajados)
+
+    def exportar(self):
+        """Devuelve todas las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            lineas = [
+                '# HELP api_peticion_duracion_segundos Latencia de las peticiones HTTP por ruta y estado',
+                '# TYPE api_peticion_duracion_segundos histogram'
+            ]
+            for valores, histograma in sorted(self._peticiones.items()):
+                lineas.extend(histograma.lineas('api_peticion_duracion_segundos', ('metodo', 'ruta', 'estado'), valores))
+
+            lineas += [
+                '# HELP api_backend_duracion_segundos Duración de las llamadas a Firestore y Storage',
+                '# TYPE api_backend_duracion_segundos histogram'
+            ]
+            for valores, histograma in sorted(self._operaciones.items()):
+                lineas.extend(histograma.lineas('api_backend_duracion_segundos', ('servicio', 'operacion'), valores))
+
+            lineas += [
+                '# HELP api_backend_errores_total Llamadas a Firestore y Storage que lanzaron una excepción',
+                '# TYPE api_backend_errores_total counter'
+            ]
+            for valores, cantidad in sorted(self._errores.items()):
+                lineas.append(f'api_backend_errores_total{_etiquetas(("servicio", "operacion"), valores)} {cantidad}')
+
+            lineas += [
+                '# HELP api_firestore_documentos_total Documentos leídos y escritos en Firestore',
+                '# TYPE api_firestore_documentos_total counter'
+            ]
+            for tipo, cantidad in self._documentos.items():
+                lineas.append(f'api_firestore_documentos_total{{tipo="{tipo}"}} {cantidad}')
+
+            lineas += [
+                '# HELP api_storage_bytes_total Bytes subidos y descargados de Storage',
+                '# TYPE api_storage_bytes_total counter'
+            ]
+            for direccion, cantidad in self._bytes.items():
+                lineas.append(f'api_storage_bytes_total{{direccion="{direccion}"}} {cantidad}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _desenvolver(valor):
+    # El SDK recibe siempre los objetos originales, nunca las envolturas
+    if isinstance(valor, _Instrumentado):
+        return object.__getattribute__(valor, '_objeto')
+    if isinstance(valor, (list, tuple)):
+        return type(valor)(_desenvolver(elemento) for elemento in valor)
+    if isinstance(valor, dict):
+        return {clave: _desenvolver(elemento) for clave, elemento in valor.items()}
+    return valor
+
+
+class _Instrumentado:
+    """Envoltura de un objeto de Firestore o Storage que mide las llamadas al backend."""
+
+    __slots__ = ('_objeto', '_tipo', '_servicio', '_metricas')
+
+    def __init__(self, objeto, tipo, servicio, metricas):
+        object.__setattr__(self, '_objeto', objeto)
+        object.__setattr__(self, '_tipo', tipo)
+        object.__setattr__(self, '_servicio', servicio)
+        object.__setattr__(self, '_metricas', metricas)
+
+    def _envolver(self, valor, tipo):
+        if valor is None:
+            return None
+        return _Instrumentado(valor, tipo, self._servicio, self._metricas)
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        tipo_resultado = NAVEGACION[self._tipo].get(nombre)
+        if tipo_resultado is not None:
+            if not callable(valor):
+                return self._envolver(valor, tipo_resultado)  # p. ej. snapshot.reference
+
+            def navegar(*args, **kwargs):
+                return self._envolver(valor(*_desenvolver(args), **_desenvolver(kwargs)), tipo_resultado)
+            return navegar
+
+        operacion = OPERACIONES[self._tipo].get(nombre)
+        if operacion is None:
+            return valor
+
+        def medir(*args, **kwargs):
+            return self._llamar(valor, operacion, _desenvolver(args), _desenvolver(kwargs))
+        return medir
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._objeto, nombre, valor)
+
+    def __len__(self):
+        return len(self._objeto)
+
+    def __bool__(self):
+        return bool(self._objeto)
+
+    def __repr__(self):
+        return f'<{self._servicio} instrumentado {self._objeto!r}>'
+
+    def _registrar(self, operacion, inicio, error=False, leidos=0, escritos=0, subidos=0, bajados=0):
+        self._metricas.registrar_operacion(self._servicio, operacion, time.perf_counter() - inicio,
+                                           leidos=leidos, escritos=escritos, subidos=subidos,
+                                           bajados=bajados, error=error)
+
+    def _llamar(self, metodo, operacion, args, kwargs):
+        nombre, conteo = operacion
+        inicio = time.perf_counter()
+        try:
+            resultado = metodo(*args, **kwargs)
+        except Exception:
+            self._registrar(nombre, inicio, error=True)
+            raise
+
+        if conteo in ('lecturas', 'blobs'):
+            tipo = 'snapshot' if conteo == 'lecturas' else 'blob'
+            if isinstance(resultado, list):
+                self._registrar(nombre, inicio, leidos=len(resultado) if tipo == 'snapshot' else 0)
+                return [self._envolver(elemento, tipo) for elemento in resultado]
+            # Los iteradores se miden mientras se consumen
+            return self._iterar(resultado, nombre, tipo, time.perf_counter() - inicio)
+        if conteo == 'lectura':
+            self._registrar(nombre, inicio, leidos=1)
+            return self._envolver(resultado, 'snapshot')
+        if conteo == 'escritura':
+            self._registrar(nombre, inicio, escritos=1)
+        elif conteo == 'agregar':
+            self._registrar(nombre, inicio, escritos=1)
+            momento, referencia = resultado
+            return momento, self._envolver(referencia, 'referencia')
+        elif conteo == 'blob':
+            self._registrar(nombre, inicio)
+            return self._envolver(resultado, 'blob')
+        elif conteo == 'subida':
+            datos = args[0] if args else kwargs.get('data', b'')
+            self._registrar(nombre, inicio, subidos=len(datos))
+        elif conteo == 'subida_archivo':
+            self._registrar(nombre, inicio, subidos=getattr(self._objeto, 'size', None) or 0)
+        elif conteo == 'bajada':
+            self._registrar(nombre, inicio, bajados=len(resultado or b''))
+        else:
+            self._registrar(nombre, inicio)
+        return resultado
+
+    def _iterar(self, iterador, operacion, tipo, duracion):
+        cantidad = 0
+        error = False
+        try:
+            iterador = iter(iterador)
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    duracion += time.perf_counter() - inicio
+                    break
+                duracion += time.perf_counter() - inicio
+                cantidad += 1
+                yield self._envolver(elemento, tipo)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._metricas.registrar_operacion(self._servicio, operacion, duracion,
+                                               leidos=cantidad if tipo == 'snapshot' else 0, error=error)
+
+
+def instrumentar_firestore(cliente, metricas):
+    return _Instrumentado(cliente, 'cliente', 'firestore', metricas)
+
+
+def instrumentar_storage(bucket, metricas):
+    return _Instrumentado(bucket, 'bucket', 'storage', metricas)
+
+
+def instalar_metricas(app, metricas, umbral_lento=None):
+    """Mide cada petición; con umbral_lento (segundos) registra el desglose de las que lo superan.
+
+    Debe instalarse antes que los demás after_request para que su tiempo quede incluido.
+    """
+
+    @app.before_request
+    def iniciar_medicion():
+        g.metricas_inicio = time.perf_counter()
+        g.metricas_registro = RegistroPeticion()
+        g.metricas_token = _registro_actual.set(g.metricas_registro)
+
+    @app.after_request
+    def registrar_peticion(respuesta):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return respuesta
+        duracion = time.perf_counter() - inicio
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        metricas.observar_peticion(request.method, ruta, respuesta.status_code, duracion)
+
+        registro = g.get('metricas_registro')
+        if umbral_lento is not None and duracion >= umbral_lento and registro is not None:
+            llamadas_fs, segundos_fs = registro.por_servicio('firestore')
+            llamadas_st, segundos_st = registro.por_servicio('storage')
+            logger.warning(
+                "Petición lenta: %s %s %s en %.1f ms | firestore %.1f ms en %d llamadas (%d leídos, %d escritos) "
+                "| storage %.1f ms en %d llamadas (%d bytes) | aplicación %.1f ms | %s",
+                request.method, ruta, respuesta.status_code, duracion * 1000,
+                segundos_fs * 1000, llamadas_fs, registro.documentos_leidos, registro.documentos_escritos,
+                segundos_st * 1000, llamadas_st, registro.bytes,
+                max(0.0, duracion - segundos_fs - segundos_st) * 1000, registro.desglose() or 'sin llamadas')
+        return respuesta
+
+    @app.teardown_request
+    def terminar_medicion(error=None):
+        token = g.pop('metricas_token', None)
+        if token is not None:
+            _registro_actual.reset(token)
@@ -0,0 +1,225 @@
+"""Procesamiento en segundo plano de las imágenes de los bienes raíces.
+
+Las imágenes se guardan por contenido: el hash SHA-256 del archivo original
+se calcula mientras se recibe y da nombre a los blobs, así una imagen repetida
+se reutiliza en lugar de subirse de nuevo. El original se guarda en
+imagenes/<hash>/original antes de responder, así el trabajo no se pierde si el
+proceso termina. Un pool de hilos lee ese original, genera las variantes
+(miniatura, tarjeta y completa) en WebP, las sube en paralelo a Storage y
+actualiza imagen_url y el mapa de variantes de todos los bienes raíces que
+esperan esa imagen.
+"""
+import hashlib
+import io
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow solo se sube la imagen original
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Nombre de la variante -> tamaño máximo del lado más largo en píxeles
+VARIANTES = {
+    'miniatura': 320,
+    'tarjeta': 800,
+    'completa': 1920
+}
+CALIDAD_WEBP = 80
+TAMANO_BLOQUE = 64 * 1024
+# Hasta este tamaño el archivo temporal se mantiene en memoria
+MAXIMO_EN_MEMORIA = 1024 * 1024
+COLECCION_IMAGENES = 'imagenes'
+
+
+class ColaLlena(Exception):
+    pass
+
+
+def blob_original(imagen_hash):
+    return f'{COLECCION_IMAGENES}/{imagen_hash}/original'
+
+
+def url_publica(bucket, nombre_blob):
+    return f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/{quote(nombre_blob, safe='')}?alt=media"
+
+
+def hashear_archivo(archivo):
+    """Copia el archivo a un temporal calculando su SHA-256 por bloques.
+
+    Devuelve (hash, temporal, tamaño); el temporal queda al inicio y solo pasa
+    a disco si supera MAXIMO_EN_MEMORIA.
+    """
+    sha = hashlib.sha256()
+    temporal = tempfile.SpooledTemporaryFile(max_size=MAXIMO_EN_MEMORIA)
+    tamano = 0
+    for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b''):
+        sha.update(bloque)
+        temporal.write(bloque)
+        tamano += len(bloque)
+    temporal.seek(0)
+    return sha.hexdigest(), temporal, tamano
+
+
+def generar_variantes(archivo, content_type=None):
+    """Devuelve {variante: (bytes, content_type, extension)} a partir de la imagen original."""
+    if Image is None:
+        return {'completa': (archivo.read(), content_type or 'application/octet-stream', 'original')}
+
+    with Image.open(archivo) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+        variantes = {}
+        for nombre, lado in VARIANTES.items():
+            copia = original.copy()
+            copia.thumbnail((lado, lado), Image.LANCZOS)  # Nunca agranda la imagen
+            salida = io.BytesIO()
+            copia.save(salida, format='WEBP', quality=CALIDAD_WEBP, method=4)
+            variantes[nombre] = (salida.getvalue(), 'image/webp', 'webp')
+        return variantes
+
+
+class ProcesadorImagenes:
+    def __init__(self, bucket, db, workers=4, cola_maxima=100, al_completar=None):
+        self.bucket = bucket
+        self.db = db
+        self.cola_maxima = cola_maxima
+        self.al_completar = al_completar
+        self._ejecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='imagenes')
+        self._subidas = ThreadPoolExecutor(max_workers=workers * len(VARIANTES), thread_name_prefix='subidas')
+        self._lock = threading.Lock()
+        self._espacio = threading.Condition(self._lock)
+        self.pendientes = 0
+        self.en_proceso = 0
+        self.completados = 0
+        self.fallidos = 0
+        self.reutilizadas = 0
+        self.tiempo_total = 0.0
+        self.tiempo_maximo = 0.0
+
+    def saturado(self):
+        with self._lock:
+            return self.pendientes >= self.cola_maxima
+
+    def guardar_original(self, imagen_hash, archivo, content_type=None):
+        """Sube el archivo original, que no es público, y lo cierra."""
+        with archivo:
+            self.bucket.blob(blob_original(imagen_hash)).upload_from_file(
+                archivo, content_type=content_type or 'application/octet-stream')
+
+    def guardar_originales(self, originales):
+        """Sube en paralelo los originales {hash: (archivo, content_type)}.
+
+        Usa el pool acotado de subidas. Devuelve {hash: excepción} con los que fallaron.
+        """
+        futuros = {imagen_hash: self._subidas.submit(self.guardar_original, imagen_hash, archivo, content_type)
+                   for imagen_hash, (archivo, content_type) in originales.items()}
+        errores = {}
+        for imagen_hash, futuro in futuros.items():
+            try:
+                futuro.result()
+            except Exception as e:
+                logger.exception("No se pudo guardar el original de la imagen %s", imagen_hash)
+                errores[imagen_hash] = e
+        return errores
+
+    def encolar(self, imagen_hash, content_type=None, esperar=False):
+        """Agenda el procesamiento del original ya guardado con guardar_original.
+
+        Si la cola está llena lanza ColaLlena, o con esperar=True bloquea hasta que haya lugar.
+        """
+        with self._espacio:
+            while self.pendientes >= self.cola_maxima:
+                if not esperar:
+                    raise ColaLlena("La cola de procesamiento de imágenes está llena")
+                self._espacio.wait()
+            self.pendientes += 1
+        return self._ejecutor.submit(self._procesar, imagen_hash, content_type)
+
+    def contar_reutilizada(self):
+        with self._lock:
+            self.reutilizadas += 1
+
+    def _subir(self, nombre_blob, datos, content_type):
+        blob = self.bucket.blob(nombre_blob)
+        blob.upload_from_string(datos, content_type=content_type)
+        blob.make_public()
+        return url_publica(self.bucket, nombre_blob)
+
+    def _procesar(self, imagen_hash, content_type):
+        inicio = time.perf_counter()
+        with self._lock:
+            self.en_proceso += 1
+        try:
+            original = self.bucket.blob(blob_original(imagen_hash)).download_as_bytes()
+            variantes = generar_variantes(io.BytesIO(original), content_type)
+            futuros = {
+                nombre: self._subidas.submit(self._subir, f'{COLECCION_IMAGENES}/{imagen_hash}/{nombre}.{extension}', datos, tipo)
+                for nombre, (datos, tipo, extension) in variantes.items()
+            }
+            urls = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+            registro = {'estado': 'lista', 'variantes': urls}
+            cambios = {
+                'imagen_url': urls['completa'],
+                'imagenes': urls,
+                'imagen_estado': 'lista'
+            }
+            exito = True
+        except Exception:
+            logger.exception("Error al procesar la imagen %s", imagen_hash)
+            registro = {'estado': 'error'}
+            cambios = {'imagen_estado': 'error'}
+            exito = False
+
+        try:
+            self.db.collection(COLECCION_IMAGENES).document(imagen_hash).update(registro)
+            # Todos los bienes raíces que esperan esta imagen reciben las variantes, también los
+            # que quedaron con error en un intento anterior
+            estados = ['pendiente', 'error'] if exito else ['pendiente']
+            pendientes = (self.db.collection('bienes_raices')
+                          .where('imagen_hash', '==', imagen_hash)
+                          .where('imagen_estado', 'in', estados)
+                          .stream())
+            for doc in pendientes:
+                doc.reference.update(cambios)
+                if self.al_completar is not None:
+                    self.al_completar(doc.id, cambios)
+        except Exception:
+            logger.exception("No se pudieron actualizar los bienes raíces de la imagen %s", imagen_hash)
+            exito = False
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self.pendientes -= 1
+                self.en_proceso -= 1
+                self.completados += exito
+                self.fallidos += not exito
+                self.tiempo_total += duracion
+                self.tiempo_maximo = max(self.tiempo_maximo, duracion)
+                self._espacio.notify()
+
+    def estadisticas(self):
+        with self._lock:
+            terminados = self.completados + self.fallidos
+            return {
+                'en_cola': self.pendientes - self.en_proceso,
+                'en_proceso': self.en_proceso,
+                'cola_maxima': self.cola_maxima,
+                'completados': self.completados,
+                'fallidos': self.fallidos,
+                'reutilizadas': self.reutilizadas,
+                'tiempo_promedio_ms': (self.tiempo_total / terminados * 1000) if terminados else 0.0,
+                'tiempo_maximo_ms': self.tiempo_maximo * 1000,
+                'pillow_disponible': Image is not None
+            }
+
+    def cerrar(self, esperar=True):
+        self._ejecutor.shutdown(wait=esperar)
+        self._subidas.shutdown(wait=esperar)
@@ -0,0 +1,65 @@
+"""Reconstruye los resúmenes de ventas a partir de la colección ventas.
+
+Se usa una vez para cargar las ventas registradas antes de que existieran los
+resúmenes, o para corregirlos. Cada resumen queda completo en el shard 0 y los
+demás shards se vacían.
+
+Puede correr con la aplicación en uso: el resumen de cada usuario se reconstruye
+en su propia transacción, que lee sus shards y sus ventas antes de escribir.
+registrar_venta escribe un shard de ambos usuarios en el mismo commit que la
+venta, así que una venta registrada en paralelo hace reintentar la transacción
+en vez de perderse.
+
+Uso:
+    python Proyecto-Computaci-n-en-la-Nube-master/recalcular_resumen_ventas.py
+"""
+import app as aplicacion
+
+
+def sumar(destino, venta):
+    precio = venta.get('precio_final') or 0
+    mes = (venta.get('fecha_venta') or '')[:7] or 'sin_fecha'
+    destino['cantidad'] += 1
+    destino['total'] += precio
+    for grupo, clave in (('por_estado', venta.get('estado') or 'sin_estado'),
+                         ('por_forma_pago', venta.get('forma_pago') or 'sin_forma_pago'),
+                         ('por_mes', mes)):
+        valores = destino[grupo].setdefault(clave, {'cantidad': 0, 'total': 0})
+        valores['cantidad'] += 1
+        valores['total'] += precio
+
+
+@aplicacion.firestore.transactional
+def reconstruir(transaccion, rol, usuario_id):
+    db = aplicacion.db
+    referencias = aplicacion.referencias_resumen(rol, usuario_id)
+    # Leer todos los shards los incluye en la transacción: si una venta escribe en alguno, se reintenta
+    list(db.get_all(referencias, transaction=transaccion))
+    resumen = {'cantidad': 0, 'total': 0, 'por_estado': {}, 'por_forma_pago': {}, 'por_mes': {}}
+    for doc in db.collection('ventas').where(f'{rol}_id', '==', usuario_id).stream(transaction=transaccion):
+        sumar(resumen, doc.to_dict())
+
+    primero, *resto = referencias
+    transaccion.set(primero, dict(resumen, rol=rol, usuario_id=usuario_id))
+    for referencia in resto:
+        transaccion.delete(referencia)
+
+
+def main():
+    db = aplicacion.db
+    # Solo se juntan los usuarios; sus ventas se vuelven a leer dentro de cada transacción
+    usuarios = set()
+    query = db.collection('ventas').order_by('__name__').select(['vendedor_id', 'comprador_id'])
+    for doc in aplicacion.iterar_paginado(query):
+        venta = doc.to_dict()
+        for rol in ('vendedor', 'comprador'):
+            if venta.get(f'{rol}_id'):
+                usuarios.add((rol, venta[f'{rol}_id']))
+
+    for rol, usuario_id in sorted(usuarios):
+        reconstruir(db.transaction(), rol, usuario_id)
+    print(f'Resúmenes recalculados: {len(usuarios)}')
+
+
+if __name__ == '__main__':
+    main()
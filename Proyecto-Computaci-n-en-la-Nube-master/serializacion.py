@@ -0,0 +1,60 @@
+"""Serialización rápida de listas grandes de documentos.
+
+En lugar de armar un dict por documento con los valores por defecto y luego
+recorrerlo de nuevo con marshal() de flask-restx, Serializador precalcula por
+cada campo del modelo su valor por defecto y su conversión de tipo, y arma cada
+fila en una sola pasada. El resultado es el mismo que el de marshal(); los
+modelos de flask-restx quedan solo como documentación de Swagger. El JSON se
+codifica con orjson si está instalado.
+"""
+import json
+
+from flask_restx import fields
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa el módulo json de la biblioteca estándar
+    orjson = None
+
+# Conversión que aplica marshal() a cada tipo de campo; los demás (Raw) se devuelven tal cual
+CONVERSIONES = {
+    fields.String: str,
+    fields.Float: float,
+    fields.Integer: int
+}
+
+
+def codificar_json(valor):
+    """Codifica el valor en JSON compacto y devuelve bytes UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(valor, default=str)
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class Serializador:
+    """Convierte documentos en filas con los campos de un modelo.
+
+    Con convertir=False no se aplican las conversiones de tipo, solo los valores por defecto.
+    """
+
+    __slots__ = ('campos', '_columnas', '_convertir_id')
+
+    def __init__(self, modelo, defectos, campos=None, convertir=True):
+        nombres = [campo for campo in modelo if campo != 'id'] if campos is None else list(campos)
+        self.campos = ('id',) + tuple(nombres)
+        # (campo, valor por defecto, conversión) de cada columna
+        self._columnas = tuple(
+            (campo, defectos.get(campo), CONVERSIONES.get(type(modelo[campo])) if convertir else None)
+            for campo in nombres)
+        self._convertir_id = convertir
+
+    def fila(self, doc_id, datos):
+        fila = {'id': str(doc_id) if self._convertir_id else doc_id}
+        for campo, defecto, conversion in self._columnas:
+            valor = datos.get(campo, defecto)
+            fila[campo] = valor if valor is None or conversion is None else conversion(valor)
+        return fila
+
+    def filas(self, docs):
+        fila = self.fila
+        return [fila(doc.id, doc.to_dict() or {}) for doc in docs]
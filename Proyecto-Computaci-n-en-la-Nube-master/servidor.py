@@ -0,0 +1,175 @@
+"""Servidor de producción con varios workers preforkeados y un pool de hilos por worker.
+
+El proceso principal importa la app y abre el socket una sola vez, y luego
+hace fork de los workers. Todos aceptan conexiones del mismo socket. La app no
+crea clientes de Firebase al importarse: cada worker crea los suyos en su
+primera petición, así ningún canal gRPC cruza un fork. Si un worker termina
+inesperadamente, el proceso principal lo reemplaza.
+
+Cada worker guarda estado en su propia memoria: la caché de lecturas y el
+índice de /bienes_raices/buscar. Para que las escrituras de un worker se vean
+en los demás, varios workers requieren INDICE_LISTENER=1 (el índice sigue a
+Firestore con un listener) y CACHE_REDIS_URL (versiones de la caché
+compartidas). Sin ambas variables el servidor usa un worker por defecto y
+advierte al iniciar si se piden más. Con el backend en memoria cada worker
+tiene sus propios datos; úselo con un solo worker.
+
+Uso:
+    python Proyecto-Computaci-n-en-la-Nube-master/servidor.py --workers 4 --hilos 8 --puerto 8000
+
+La misma app funciona con gunicorn:
+    gunicorn -w 4 -k gthread --threads 8 'app:crear_app()'
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+logger = logging.getLogger(__name__)
+
+
+class ServidorConHilos(BaseWSGIServer):
+    """Servidor WSGI que atiende cada conexión en un pool de hilos acotado.
+
+    Con todos los hilos ocupados deja de aceptar conexiones, que esperan en el
+    socket compartido hasta que otro worker las tome.
+    """
+
+    def __init__(self, host, port, app, hilos, fd):
+        super().__init__(host, port, app, fd=fd)
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='http')
+        self._libres = threading.BoundedSemaphore(hilos)
+
+    def process_request(self, request, client_address):
+        self._libres.acquire()
+        self._pool.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._libres.release()
+
+    def cerrar(self):
+        # Termina las peticiones en curso antes de salir
+        self._pool.shutdown(wait=True)
+        self.server_close()
+
+
+def abrir_socket(host, puerto, backlog):
+    familia = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(familia, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def ejecutar_worker(app, sock, hilos):
+    servidor = ServidorConHilos(*sock.getsockname()[:2], app, hilos, fd=sock.fileno())
+
+    def detener(signum, frame):
+        # shutdown() espera al bucle de serve_forever, así que se llama desde otro hilo
+        threading.Thread(target=servidor.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, detener)
+    signal.signal(signal.SIGINT, detener)
+    logger.info("Worker %d atendiendo con %d hilos", os.getpid(), hilos)
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.cerrar()
+
+
+def estado_compartido_configurado():
+    # Lo que necesitan varios workers para no servir datos desactualizados entre sí
+    return os.environ.get('INDICE_LISTENER') == '1' and bool(os.environ.get('CACHE_REDIS_URL'))
+
+
+def servir(app, host='0.0.0.0', puerto=8000, workers=None, hilos=8, backlog=2048):
+    """Hace fork de los workers y los supervisa hasta recibir SIGTERM o SIGINT.
+
+    Sin workers se usa uno por núcleo si el estado compartido está configurado, o uno solo.
+    """
+    compartido = estado_compartido_configurado()
+    if not workers:
+        workers = (os.cpu_count() or 1) if compartido else 1
+    elif workers > 1 and not compartido:
+        logger.warning("Se inician %d workers sin INDICE_LISTENER=1 y CACHE_REDIS_URL: cada worker tiene su "
+                       "propia caché e índice de búsqueda y puede servir datos desactualizados", workers)
+    sock = abrir_socket(host, puerto, backlog)
+    activos = {}
+    detenido = False
+
+    def iniciar_worker():
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                ejecutar_worker(app, sock, hilos)
+            except Exception:
+                logger.exception("Error en el worker %d", os.getpid())
+                codigo = 1
+            finally:
+                os._exit(codigo)
+        activos[pid] = True
+
+    def detener(signum, frame):
+        nonlocal detenido
+        detenido = True
+        for pid in list(activos):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, detener)
+    signal.signal(signal.SIGINT, detener)
+    logger.info("Escuchando en http://%s:%d con %d workers de %d hilos", host, puerto, workers, hilos)
+    for _ in range(workers):
+        iniciar_worker()
+
+    while activos:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        activos.pop(pid, None)
+        if not detenido:
+            logger.warning("El worker %d terminó (estado %d); se inicia otro", pid, estado)
+            iniciar_worker()
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor de la API de bienes raíces con workers preforkeados')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--puerto', type=int, default=int(os.environ.get('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 0)) or None,
+                        help='Cantidad de procesos (por defecto, uno por núcleo con INDICE_LISTENER=1 '
+                             'y CACHE_REDIS_URL, o uno solo)')
+    parser.add_argument('--hilos', type=int, default=int(os.environ.get('WEB_HILOS', 8)),
+                        help='Hilos por proceso')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit('El servidor preforkeado requiere un sistema con fork(); use gunicorn o waitress')
+
+    from app import app
+    # app.py configura logging en DEBUG; en producción alcanza con INFO
+    logging.getLogger().setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+    servir(app, args.host, args.puerto, args.workers, args.hilos)
+
+
+if __name__ == '__main__':
+    main()
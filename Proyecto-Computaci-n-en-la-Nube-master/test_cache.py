@@ -0,0 +1,192 @@
+"""Pruebas de la caché de lectura de bienes raíces.
+
+Uso:
+    python -m pytest Proyecto-Computaci-n-en-la-Nube-master/test_cache.py
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import cache as modulo_cache
+from cache import CacheLRU
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    # Solo el módulo de la caché ve el reloj falso
+    monkeypatch.setattr(modulo_cache, 'time', SimpleNamespace(monotonic=reloj))
+    return reloj
+
+
+class BackendEnMemoria:
+    """Backend compartido mínimo, como el de Redis pero en un diccionario."""
+
+    def __init__(self):
+        self.valores = {}
+        self.versiones = {}
+
+    def obtener(self, clave):
+        return self.valores.get(clave)
+
+    def guardar(self, clave, valor, ttl):
+        self.valores[clave] = valor
+
+    def version(self, espacio):
+        return self.versiones.get(espacio, 0)
+
+    def incrementar_version(self, espacio):
+        self.versiones[espacio] = self.versiones.get(espacio, 0) + 1
+        return self.versiones[espacio]
+
+
+def test_las_lecturas_concurrentes_cargan_una_sola_vez():
+    cache = CacheLRU()
+    lectores = 8
+    empezo, liberar = threading.Event(), threading.Event()
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        empezo.set()
+        assert liberar.wait(5)
+        return {'id': 'a'}
+
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(cache.obtener('a', cargar))) for _ in range(lectores)]
+    for hilo in hilos:
+        hilo.start()
+    # La carga sigue en curso mientras los demás hilos piden la misma clave
+    assert empezo.wait(5)
+    time.sleep(0.05)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert cargas == [1]
+    assert resultados == [{'id': 'a'}] * lectores
+    assert cache.obtener('a', cargar) == {'id': 'a'}
+    assert cache.estadisticas()['fallos'] == 1
+
+
+def test_el_error_de_la_carga_llega_a_quienes_esperan():
+    cache = CacheLRU()
+    empezo, liberar = threading.Event(), threading.Event()
+
+    def fallar():
+        empezo.set()
+        assert liberar.wait(5)
+        raise ValueError('sin conexión')
+
+    errores = []
+
+    def leer():
+        try:
+            cache.obtener('a', fallar)
+        except ValueError as e:
+            errores.append(e)
+
+    lider = threading.Thread(target=leer)
+    lider.start()
+    assert empezo.wait(5)
+    seguidor = threading.Thread(target=leer)
+    seguidor.start()
+    liberar.set()
+    lider.join(5)
+    seguidor.join(5)
+
+    assert len(errores) == 2
+    # El error no queda en caché: la siguiente lectura vuelve a cargar
+    assert cache.obtener('a', lambda: 'ok') == 'ok'
+
+
+def test_las_entradas_expiran_por_ttl(reloj):
+    cache = CacheLRU(ttl=60)
+    cargas = []
+
+    def cargar():
+        cargas.append(1)
+        return len(cargas)
+
+    assert cache.obtener('a', cargar) == 1
+    assert cache.obtener('b', cargar, ttl=5) == 2
+    reloj.ahora += 30
+    assert cache.obtener('a', cargar) == 1
+    assert cache.obtener('b', cargar, ttl=5) == 3
+    reloj.ahora += 31
+    assert cache.obtener('a', cargar) == 4
+
+
+def test_los_valores_none_no_se_guardan():
+    cache = CacheLRU()
+    cargas = []
+    assert cache.obtener('a', lambda: cargas.append(1)) is None
+    assert cache.obtener('a', lambda: cargas.append(1)) is None
+    assert cargas == [1, 1]
+
+
+def test_desaloja_la_entrada_usada_hace_mas_tiempo():
+    cache = CacheLRU(capacidad=2)
+    cache.obtener('a', lambda: 'A')
+    cache.obtener('b', lambda: 'B')
+    cache.obtener('a', lambda: 'otro')  # 'a' pasa a ser la más reciente
+    cache.obtener('c', lambda: 'C')
+
+    assert cache.obtener('a', lambda: 'otro') == 'A'
+    assert cache.obtener('c', lambda: 'otro') == 'C'
+    assert cache.obtener('b', lambda: 'B de nuevo') == 'B de nuevo'
+    estadisticas = cache.estadisticas()
+    assert estadisticas['entradas'] == 2
+    assert estadisticas['desalojos'] == 2
+
+
+def leer_versionado(cache, espacio, cargar):
+    return cache.obtener(f'{espacio}:v{cache.version(espacio)}', cargar)
+
+
+def test_incrementar_la_version_invalida_solo_su_espacio():
+    cache = CacheLRU()
+    assert leer_versionado(cache, 'bien_raiz:a', lambda: 'a1') == 'a1'
+    assert leer_versionado(cache, 'bien_raiz:b', lambda: 'b1') == 'b1'
+
+    assert cache.incrementar_version('bien_raiz:a') == 1
+    assert leer_versionado(cache, 'bien_raiz:a', lambda: 'a2') == 'a2'
+    assert leer_versionado(cache, 'bien_raiz:b', lambda: 'b2') == 'b1'
+
+
+def test_las_versiones_desalojadas_no_se_repiten():
+    cache = CacheLRU(capacidad_versiones=2)
+    for _ in range(3):
+        cache.incrementar_version('a')
+    assert leer_versionado(cache, 'a', lambda: 'a antes') == 'a antes'
+
+    # 'b' y 'c' desalojan la versión de 'a', que no debe volver a una versión ya usada
+    cache.incrementar_version('b')
+    cache.incrementar_version('c')
+    assert len(cache._versiones) == 2
+    assert cache.version('a') > 3
+    assert leer_versionado(cache, 'a', lambda: 'a después') == 'a después'
+    # Cada incremento sigue avanzando de a uno, como espera el índice de búsqueda
+    version = cache.version('a')
+    assert cache.incrementar_version('a') == version + 1
+
+
+def test_con_backend_las_versiones_son_las_compartidas():
+    backend = BackendEnMemoria()
+    cache, otro_worker = CacheLRU(backend=backend), CacheLRU(backend=backend)
+    assert leer_versionado(cache, 'bien_raiz:a', lambda: 'viejo') == 'viejo'
+
+    assert otro_worker.incrementar_version('bien_raiz:a') == 1
+    # La copia local del primer worker queda con la versión anterior y no se lee
+    assert leer_versionado(cache, 'bien_raiz:a', lambda: 'nuevo') == 'nuevo'
+    assert leer_versionado(otro_worker, 'bien_raiz:a', lambda: 'no se carga') == 'nuevo'
@@ -0,0 +1,109 @@
+"""Pruebas de la cobertura de geohash usada por /bienes_raices/cercanos.
+
+Comparan las celdas y rangos calculados con una verificación por fuerza bruta:
+cada punto dentro del rectángulo debe caer en alguno de los rangos consultados.
+
+Uso:
+    python -m pytest Proyecto-Computaci-n-en-la-Nube-master/test_geoespacial.py
+"""
+import random
+
+import pytest
+
+from geoespacial import (MAXIMO_CELDAS, PRECISION_GEOHASH, celdas_del_rectangulo, codificar, dentro_del_rectangulo,
+                         diagonal_km, rangos_de_celdas, rectangulo_de_radio)
+
+RECTANGULOS = {
+    'ciudad': (-33.60, -70.80, -33.30, -70.50),
+    'ecuador_y_greenwich': (-0.5, -0.5, 0.5, 0.5),
+    'antimeridiano': (-17.5, 179.2, -16.5, -179.6),
+    'antimeridiano_norte': (64.0, 178.0, 66.0, -178.0),
+    'polo_norte': (89.2, -180.0, 90.0, 180.0),
+    'polo_sur': (-90.0, -180.0, -89.5, 180.0),
+    'borde_del_mundo': (89.9, 179.9, 90.0, 180.0),
+    'punto': (10.0, 20.0, 10.0, 20.0),
+    'continente': (-40.0, -80.0, 10.0, -30.0),
+    'mundo': (-90.0, -180.0, 90.0, 180.0)
+}
+
+
+def puntos_del_rectangulo(rectangulo, cantidad=2000, semilla=7):
+    # Esquinas, bordes y puntos al azar dentro del rectángulo, con longitudes en [-180, 180]
+    lat_min, lng_min, lat_max, lng_max = rectangulo
+    ancho = lng_max - lng_min if lng_min <= lng_max else lng_max - lng_min + 360
+
+    def longitud(fraccion):
+        # Los extremos se usan tal cual para no salir del rectángulo por redondeo
+        if fraccion in (0.0, 1.0):
+            return lng_min if fraccion == 0.0 else lng_max
+        lng = lng_min + fraccion * ancho
+        return lng if lng <= 180.0 else lng - 360
+
+    aleatorio = random.Random(semilla)
+    puntos = [(lat, longitud(fraccion))
+              for lat in (lat_min, lat_max, (lat_min + lat_max) / 2)
+              for fraccion in (0.0, 0.25, 0.5, 0.75, 1.0)]
+    for _ in range(cantidad):
+        puntos.append((aleatorio.uniform(lat_min, lat_max), longitud(aleatorio.random())))
+    return puntos
+
+
+def en_algun_rango(geohash, rangos):
+    return any(inicio <= geohash < fin for inicio, fin in rangos)
+
+
+@pytest.mark.parametrize('nombre', sorted(RECTANGULOS))
+def test_los_rangos_cubren_todos_los_puntos_del_rectangulo(nombre):
+    rectangulo = RECTANGULOS[nombre]
+    celdas = celdas_del_rectangulo(rectangulo)
+    rangos = rangos_de_celdas(celdas)
+    assert len(celdas) <= MAXIMO_CELDAS
+    for latitud, longitud in puntos_del_rectangulo(rectangulo):
+        assert dentro_del_rectangulo(latitud, longitud, rectangulo)
+        geohash = codificar(latitud, longitud)
+        # Cada celda es un prefijo del geohash de los puntos que contiene
+        assert any(geohash.startswith(celda) for celda in celdas), (latitud, longitud)
+        assert en_algun_rango(geohash, rangos), (latitud, longitud)
+
+
+@pytest.mark.parametrize('latitud,longitud,radio_km', [
+    (-33.45, -70.66, 1),
+    (-33.45, -70.66, 100),
+    (0.0, 179.95, 50),
+    (0.0, -179.95, 50),
+    (89.7, 45.0, 60),
+    (-89.9, -120.0, 20)
+])
+def test_los_rangos_cubren_el_rectangulo_de_un_radio(latitud, longitud, radio_km):
+    rectangulo = rectangulo_de_radio(latitud, longitud, radio_km)
+    rangos = rangos_de_celdas(celdas_del_rectangulo(rectangulo))
+    for punto in puntos_del_rectangulo(rectangulo, cantidad=1000):
+        assert en_algun_rango(codificar(*punto), rangos), punto
+
+
+def test_un_rectangulo_pequeno_usa_la_mayor_precision_posible():
+    celdas = celdas_del_rectangulo(RECTANGULOS['punto'])
+    assert celdas == [codificar(10.0, 20.0)]
+    assert len(celdas[0]) == PRECISION_GEOHASH
+
+
+def test_el_mundo_se_cubre_con_un_solo_rango():
+    assert rangos_de_celdas(celdas_del_rectangulo(RECTANGULOS['mundo'])) == [('', '~')]
+
+
+def test_rangos_une_celdas_contiguas():
+    assert rangos_de_celdas(['b', 'c', 'f']) == [('b', 'd'), ('f', 'g')]
+    assert rangos_de_celdas(['zz']) == [('zz', '~')]
+
+
+@pytest.mark.parametrize('rectangulo,maximo', [
+    ((-33.60, -70.80, -33.30, -70.50), 50),
+    ((-17.5, 179.2, -16.5, -179.6), 200),
+    ((0.0, -179.5, 0.5, 179.5), None)
+])
+def test_diagonal_del_rectangulo(rectangulo, maximo):
+    if maximo is None:
+        # Sin cruzar el antimeridiano abarca casi toda la vuelta al mundo
+        assert diagonal_km(rectangulo) > 30000
+    else:
+        assert diagonal_km(rectangulo) < maximo
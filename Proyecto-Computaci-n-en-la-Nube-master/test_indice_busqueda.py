@@ -0,0 +1,181 @@
+"""Pruebas del índice en memoria de /bienes_raices/buscar.
+
+Cada búsqueda se compara con una implementación directa que filtra y ordena
+todos los documentos.
+
+Uso:
+    python -m pytest Proyecto-Computaci-n-en-la-Nube-master/test_indice_busqueda.py
+"""
+import random
+
+import pytest
+
+from indice_busqueda import IndiceBienesRaices, tokenizar
+
+PALABRAS = ['casa', 'casona', 'departamento', 'amplia', 'luminosa', 'centro', 'jardín', 'piscina', 'ñuñoa', 'vista']
+
+
+def generar_documentos(cantidad, semilla=3):
+    aleatorio = random.Random(semilla)
+    documentos = []
+    for i in range(cantidad):
+        datos = {
+            'nombre': ' '.join(aleatorio.sample(PALABRAS, 2)).capitalize(),
+            'descripcion': ' '.join(aleatorio.sample(PALABRAS, 3)),
+            'ubicacion': f'Sector {i % 7}',
+            'precio': aleatorio.randint(1, 40) * 10000,
+            'habitaciones': aleatorio.randint(1, 5),
+            'banos': aleatorio.randint(1, 3)
+        }
+        if i % 11 == 0:
+            del datos['precio']  # Sin precio cuenta como 0
+        documentos.append((f'bien{i:04d}', datos))
+    return documentos
+
+
+def buscar_directo(documentos, texto=None, precio_min=None, precio_max=None, habitaciones_min=None,
+                   banos_min=None, ordenar=None, descendente=False, offset=0, limite=20):
+    # Referencia: revisa cada documento y ordena todos los resultados
+    tokens = tokenizar(texto)
+    resultados = []
+    for doc_id, datos in documentos.items():
+        palabras = set()
+        for campo in ('nombre', 'descripcion', 'ubicacion'):
+            palabras.update(tokenizar(datos.get(campo)))
+        if tokens:
+            exactas, ultima = tokens[:-1], tokens[-1]
+            if not all(token in palabras for token in exactas):
+                continue
+            coincide = any(palabra.startswith(ultima) for palabra in palabras) if ultima.isalpha() else ultima in palabras
+            if not coincide:
+                continue
+        precio = float(datos.get('precio') or 0)
+        if precio_min is not None and precio < precio_min or precio_max is not None and precio > precio_max:
+            continue
+        if habitaciones_min is not None and datos.get('habitaciones', 0) < habitaciones_min:
+            continue
+        if banos_min is not None and datos.get('banos', 0) < banos_min:
+            continue
+        resultados.append(doc_id)
+
+    if ordenar == 'nombre':
+        clave = lambda doc_id: (str(documentos[doc_id].get('nombre') or '').lower(), doc_id)
+    elif ordenar:
+        clave = lambda doc_id: (float(documentos[doc_id].get(ordenar) or 0), doc_id)
+    else:
+        clave = lambda doc_id: doc_id
+    resultados.sort(key=clave, reverse=descendente)
+    return len(resultados), resultados[offset:offset + limite]
+
+
+def ids_de(resultado):
+    total, bienes = resultado
+    return total, [bien['id'] for bien in bienes]
+
+
+BUSQUEDAS = [
+    {},
+    {'ordenar': 'precio'},
+    {'ordenar': 'precio', 'descendente': True, 'offset': 15},
+    {'ordenar': 'nombre', 'limite': 50},
+    {'ordenar': 'nombre', 'descendente': True},
+    {'descendente': True, 'offset': 190},
+    {'texto': 'casa'},
+    {'texto': 'cas', 'ordenar': 'habitaciones'},
+    {'texto': 'Ñuñoa jardin', 'ordenar': 'banos', 'descendente': True},
+    {'texto': 'sector 3', 'precio_min': 100000},
+    {'texto': 'inexistente'},
+    {'precio_min': 150000, 'precio_max': 250000},
+    {'precio_min': 150000, 'ordenar': 'precio', 'offset': 5, 'limite': 7},
+    {'precio_max': 0, 'ordenar': 'nombre'},
+    {'habitaciones_min': 3, 'banos_min': 2, 'ordenar': 'precio'},
+    {'habitaciones_min': 1, 'banos_min': 1, 'precio_min': 0},
+    {'texto': 'vista', 'habitaciones_min': 4, 'banos_min': 3, 'precio_max': 300000, 'ordenar': 'nombre'},
+    {'banos_min': 3, 'limite': 500}
+]
+
+
+@pytest.fixture(scope='module')
+def documentos():
+    return dict(generar_documentos(400))
+
+
+@pytest.fixture
+def indice(documentos):
+    indice = IndiceBienesRaices()
+    indice.cargar(documentos.items())
+    return indice
+
+
+@pytest.mark.parametrize('busqueda', BUSQUEDAS)
+def test_buscar_coincide_con_la_busqueda_directa(indice, documentos, busqueda):
+    assert ids_de(indice.buscar(**busqueda)) == buscar_directo(documentos, **busqueda)
+
+
+def test_los_resultados_incluyen_los_datos_y_el_id(indice, documentos):
+    _, bienes = indice.buscar(ordenar='precio', limite=1)
+    bien = bienes[0]
+    assert bien == dict(documentos[bien['id']], id=bien['id'])
+    # Los resultados son copias: modificarlos no altera el índice
+    bien['nombre'] = 'modificado'
+    assert indice.buscar(ordenar='precio', limite=1)[1][0]['nombre'] != 'modificado'
+
+
+def test_los_cambios_incrementales_equivalen_a_recargar(documentos):
+    actuales = dict(documentos)
+    indice = IndiceBienesRaices()
+    indice.cargar(actuales.items())
+    aleatorio = random.Random(5)
+
+    nuevos = dict(generar_documentos(60, semilla=9))
+    for doc_id, datos in nuevos.items():
+        indice.agregar(f'nuevo-{doc_id}', datos)
+        actuales[f'nuevo-{doc_id}'] = datos
+    for doc_id in aleatorio.sample(sorted(actuales), 80):
+        cambios = {'precio': aleatorio.randint(1, 40) * 10000, 'nombre': aleatorio.choice(PALABRAS)}
+        indice.actualizar(doc_id, cambios)
+        actuales[doc_id] = dict(actuales[doc_id], **cambios)
+    for doc_id in aleatorio.sample(sorted(actuales), 70):
+        indice.eliminar(doc_id)
+        del actuales[doc_id]
+    indice.actualizar('no-existe', {'precio': 1})  # Se ignora
+    indice.eliminar('no-existe')
+
+    recargado = IndiceBienesRaices()
+    recargado.cargar(actuales.items())
+    assert len(indice) == len(recargado) == len(actuales)
+    for busqueda in BUSQUEDAS:
+        esperado = buscar_directo(actuales, **busqueda)
+        assert ids_de(indice.buscar(**busqueda)) == esperado
+        assert ids_de(recargado.buscar(**busqueda)) == esperado
+
+
+def test_eliminar_quita_los_tokens_del_vocabulario():
+    indice = IndiceBienesRaices()
+    indice.agregar('a', {'nombre': 'Casona única'})
+    assert indice.buscar(texto='unic')[0] == 1
+    indice.eliminar('a')
+    assert indice.buscar(texto='unic') == (0, [])
+    assert indice.buscar(texto='casona') == (0, [])
+
+
+def test_recarga_por_version_y_antiguedad():
+    indice = IndiceBienesRaices()
+    lecturas = []
+
+    def obtener():
+        lecturas.append(1)
+        return [('a', {'nombre': 'Casa'})]
+
+    indice.asegurar_cargado(obtener, version=1)
+    indice.asegurar_cargado(obtener, version=1)
+    assert len(lecturas) == 1
+    # Una escritura propia avanza la versión sin recargar
+    indice.avanzar_version(2)
+    indice.asegurar_cargado(obtener, version=2)
+    assert len(lecturas) == 1
+    # Una escritura de otro proceso cambia la versión y obliga a recargar
+    indice.asegurar_cargado(obtener, version=4)
+    assert len(lecturas) == 2
+    indice.asegurar_cargado(obtener, version=4, antiguedad_maxima=0)
+    assert len(lecturas) == 3
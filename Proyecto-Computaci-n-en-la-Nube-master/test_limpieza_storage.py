@@ -0,0 +1,76 @@
+"""Pruebas del borrado de imágenes sin uso con el backend en memoria.
+
+Uso:
+    python -m pytest Proyecto-Computaci-n-en-la-Nube-master/test_limpieza_storage.py
+"""
+import time
+from datetime import timedelta
+
+import pytest
+
+from backend_memoria import crear_backend_memoria, transactional
+from limpieza_storage import LimpiadorStorage
+from procesamiento_imagenes import COLECCION_IMAGENES, blob_original
+
+WORKERS = 2
+
+
+@pytest.fixture
+def entorno():
+    db, bucket, _ = crear_backend_memoria('bucket-pruebas')
+    limpiador = LimpiadorStorage(db, bucket, transactional, workers=WORKERS)
+    yield db, bucket, limpiador
+    limpiador.cerrar(esperar=False)
+
+
+def crear_imagen(db, bucket, imagen_hash, referencias=0, estado='lista'):
+    db.collection(COLECCION_IMAGENES).document(imagen_hash).set({'referencias': referencias, 'estado': estado})
+    for nombre in (blob_original(imagen_hash), f'{COLECCION_IMAGENES}/{imagen_hash}/miniatura.webp',
+                   f'{COLECCION_IMAGENES}/{imagen_hash}/completa.webp'):
+        bucket.blob(nombre).upload_from_string(b'datos')
+
+
+def test_libera_mas_imagenes_que_workers_sin_bloquearse(entorno):
+    db, bucket, limpiador = entorno
+    hashes = [f'hash{i}' for i in range(WORKERS * 4)]
+    for imagen_hash in hashes:
+        crear_imagen(db, bucket, imagen_hash)
+
+    limpiador.programar_liberacion(hashes)
+    # Se espera con un plazo en vez de cerrar el pool: si el pool se bloquea, las aserciones fallan
+    limite = time.monotonic() + 10
+    while limpiador.estadisticas()['imagenes_liberadas'] < len(hashes) and time.monotonic() < limite:
+        time.sleep(0.01)
+
+    assert limpiador.estadisticas() == {
+        'imagenes_liberadas': len(hashes),
+        'blobs_eliminados': len(hashes) * 3,
+        'errores': 0
+    }
+    assert bucket.list_blobs(prefix=f'{COLECCION_IMAGENES}/') == []
+    assert not any(db.collection(COLECCION_IMAGENES).document(h).get().exists for h in hashes)
+
+
+def test_no_libera_imagenes_en_uso_ni_pendientes(entorno):
+    db, bucket, limpiador = entorno
+    crear_imagen(db, bucket, 'usada', referencias=2)
+    crear_imagen(db, bucket, 'pendiente', estado='pendiente')
+
+    limpiador.programar_liberacion(['usada', 'pendiente'])
+    limpiador.cerrar()
+
+    assert limpiador.estadisticas()['imagenes_liberadas'] == 0
+    assert len(bucket.list_blobs(prefix=f'{COLECCION_IMAGENES}/')) == 6
+
+
+def test_el_barrido_solo_toca_el_legado_con_la_opcion(entorno):
+    db, bucket, limpiador = entorno
+    for nombre in ('foto.jpg', 'otro/config.json', 'config.json', 'boletas/boleta.pdf'):
+        bucket.blob(nombre).upload_from_string(b'datos')
+
+    reporte = limpiador.barrer(gracia=timedelta(0), simular=True)
+    assert reporte['blobs_huerfanos'] == []
+
+    reporte = limpiador.barrer(gracia=timedelta(0), incluir_legado=True)
+    assert reporte['blobs_huerfanos'] == ['foto.jpg']
+    assert sorted(blob.name for blob in bucket.list_blobs()) == ['boletas/boleta.pdf', 'config.json', 'otro/config.json']